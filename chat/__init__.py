@@ -1,3 +1,13 @@
 from .settings_router import settings_router  # noqa
-from .alert_router import alert_router, check_for_alerts_factory  # noqa
+from .alert_router import (  # noqa
+    alert_router,
+    check_for_alerts_factory,
+    resume_alert_runs_factory,
+    prefetch_forecasts_factory,
+    AlertsSettings,
+    WEATHER_FORECAST_DAYS,
+)
+from .alert_schedule import get_alert_schedule, get_prefetch_schedule  # noqa
+from .send_queue import TelegramSendQueue, TelegramSendSettings  # noqa
+from .webhook import WebhookSettings, run_webhook  # noqa
 from .messages import ChatMessages  # noqa
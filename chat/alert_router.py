@@ -1,20 +1,51 @@
+import asyncio
 import logging
+import itertools
+from datetime import UTC, date, datetime, timedelta
+from typing import TypedDict
 
 from aiogram import Bot, Router
 from aiogram.types import KeyboardButton, Message, ReplyKeyboardMarkup, ReplyKeyboardRemove
 
-from weather_forecast import WeatherForecastAPI, get_tire_type_by_avg_temperature
+from common import run_concurrently, batched
+from location import LocationKey, get_location_key, get_location_cell, get_cell_center
+from weather_forecast import (
+    DailyTemperatures,
+    WeatherForecastAPI,
+    GridWeatherForecastAPI,
+    TireDecisionRules,
+    decide_tire_switches,
+    get_chat_switches,
+    get_tire_type_by_avg_temperature,
+    pack_daily_temperatures,
+)
 from database import (
     DBSession,
-    Alert,
+    AlertRecord,
+    AlertRun,
+    CellDecision,
+    ChatSlot,
+    delete_alert_runs,
+    finish_alert_run,
+    get_alert_run_slot,
     get_alerts_to_check,
     get_alerts_to_resend,
+    get_cell_decisions,
+    get_cells_to_check,
+    get_locations_to_check,
+    get_chat_slot_key,
+    get_unfinished_alert_runs,
+    reserve_alert_deliveries,
+    confirm_alert_delivery,
+    save_cell_decisions,
+    start_alert_run,
+    try_advisory_lock,
     update_tire_type,
-    increment_alert_counter,
 )
 
 from .messages import ChatMessages
-from .helpers import get_chat_location, is_alert_expired
+from .helpers import get_chat_location
+from .alerts_checkpoint import AlertsCheckpoint
 
 logger = logging.getLogger(__name__)
 
@@ -23,46 +54,324 @@ alert_router = Router(name=__name__)
 
 WEATHER_FORECAST_DAYS = 7
 
+# key of the database lock which lets a single process run the forecast prefetch of a time zone
+PREFETCH_LOCK_KEY = 1
+
+# the alerts check of all chats at once, when they are not split into slots
+ALL_CHATS = ChatSlot(None, 0, 1)
+# runs and reserved deliveries are kept for a few days, only runs of the current day are resumed in practice
+ALERT_RUNS_RETENTION = timedelta(days=7)
+
+
+class AlertsSettings(TypedDict):
+    # size of the grid cell (in degrees) used to share forecasts between close chats
+    forecast_cell_size: float
+    # number of alerts processed concurrently
+    workers: int
+    # seconds after which processing of a single alert is abandoned
+    task_timeout: float
+    # number of alerts read from the database in a single page
+    page_size: int
+    # number of alerts whose forecasts are requested in a single batch
+    forecast_batch_size: int
+    # number of sent alerts whose updates are written in a single transaction
+    update_batch_size: int
+    # seconds over which forecast requests of the prefetch are spread
+    prefetch_window: float
+    # seconds after which alerts claimed but not processed by a (crashed) process are claimed again
+    claim_timeout: float
+    # change of the average temperature (in °C) of a grid cell after which its alerts are checked again,
+    # alerts are always checked when the tire type decision of their cell flips
+    temperature_delta: float
+    # hysteresis and consecutive days required to recommend switching tires
+    tire_decision_rules: TireDecisionRules
+
+
+def prefetch_forecasts_factory(
+    weather_forecast_api: WeatherForecastAPI,
+    db_session: DBSession,
+    settings: AlertsSettings,
+):
+    """
+    Warms the forecast cache for every grid cell with alerts to check in the slot,
+    so the alerts check only reads cached forecasts and sends messages.
+    Batches are spread evenly over the prefetch window to keep the provider load flat.
+    The forecast cache is shared through the database, so only one process prefetches a slot.
+    """
+
+    async def prefetch_forecasts(slot: ChatSlot = ALL_CHATS):
+        async with try_advisory_lock(await db_session(), get_prefetch_lock_key(slot)) as acquired:
+            if not acquired:
+                logger.info("The forecast prefetch %s is run by another process", get_chat_slot_key(slot))
+                return
+
+            await prefetch_cells(slot)
+
+    async def prefetch_cells(slot: ChatSlot):
+        cells = {}
+        async for location in get_locations_to_check(await db_session(), slot):
+            cell = get_location_cell(location, settings["forecast_cell_size"])
+            cells[get_location_key(cell)] = cell
+
+        batches = list(itertools.batched(cells.values(), settings["forecast_batch_size"]))
+
+        if not batches:
+            return
+
+        loop = asyncio.get_running_loop()
+        started_at = loop.time()
+        interval = settings["prefetch_window"] / len(batches)
+
+        for index, batch in enumerate(batches):
+            await asyncio.sleep(max(0, started_at + index * interval - loop.time()))
+
+            try:
+                await weather_forecast_api.get_many_daily_temperatures(list(batch), WEATHER_FORECAST_DAYS)
+            except Exception as e:
+                logger.exception(e)
+
+        logger.info("Prefetched forecasts for %s grid cells of %s", len(cells), get_chat_slot_key(slot))
+
+    return prefetch_forecasts
+
+
+def get_prefetch_lock_key(slot: ChatSlot) -> int:
+    # the prefetches of neighbouring time zones overlap, so every time zone has its own lock
+    return PREFETCH_LOCK_KEY * 100 + (slot.time_zone or 0)
+
 
 def check_for_alerts_factory(
     bot: Bot,
     messages: ChatMessages,
     weather_forecast_api: WeatherForecastAPI,
     db_session: DBSession,
+    settings: AlertsSettings,
 ):
-    send_alert = send_alert_factory(bot, messages, db_session)
+    sweep_alerts = sweep_alerts_factory(bot, messages, weather_forecast_api, db_session, settings)
+
+    async def check_for_alerts(slot: ChatSlot = ALL_CHATS):
+        run = await start_alert_run(await db_session(), get_alert_run_day(), slot)
+
+        # the job may fire again for a finished run, e.g. in several processes
+        if run.finished_at is None:
+            await sweep_alerts(run)
 
-    async def check_for_alerts():
+    return check_for_alerts
+
+
+def resume_alert_runs_factory(
+    bot: Bot,
+    messages: ChatMessages,
+    weather_forecast_api: WeatherForecastAPI,
+    db_session: DBSession,
+    settings: AlertsSettings,
+):
+    """
+    Resumes the alerts checks left unfinished by crashed processes, once the alerts they claimed can be claimed again.
+    """
+    sweep_alerts = sweep_alerts_factory(bot, messages, weather_forecast_api, db_session, settings)
+
+    async def resume_alert_runs():
         async_session = await db_session()
+        await delete_alert_runs(async_session, get_alert_run_day() - ALERT_RUNS_RETENTION)
+
+        started_before = datetime.now(UTC) - timedelta(seconds=settings["claim_timeout"])
 
-        async for alert in get_alerts_to_resend(async_session):
-            await send_alert(alert)
+        for run in await get_unfinished_alert_runs(async_session, started_before):
+            logger.info("Resuming the alerts check %s of %s", run.slot_key, run.day)
+            await sweep_alerts(run)
 
-        async for alert in get_alerts_to_check(async_session):
-            chat = alert.chat
+    return resume_alert_runs
 
-            avg_temperature = await weather_forecast_api.get_avg_temperature(
-                get_chat_location(chat), WEATHER_FORECAST_DAYS
+
+def get_alert_run_day() -> date:
+    # rounded to the minute, so processes starting a run around midnight agree on its day
+    return (datetime.now(UTC) + timedelta(seconds=30)).date()
+
+
+def sweep_alerts_factory(
+    bot: Bot,
+    messages: ChatMessages,
+    weather_forecast_api: WeatherForecastAPI,
+    db_session: DBSession,
+    settings: AlertsSettings,
+):
+    send_alert = send_alert_factory(bot, messages)
+    claim_timeout = timedelta(seconds=settings["claim_timeout"])
+
+    async def sweep_alerts(run: AlertRun):
+        async_session = await db_session()
+        slot = get_alert_run_slot(run)
+        grid_forecast_api = GridWeatherForecastAPI(weather_forecast_api, settings["forecast_cell_size"])
+        checkpoint = AlertsCheckpoint(db_session, settings["update_batch_size"], run.day)
+
+        async def evaluate_cells():
+            """
+            Save decisions of the cells whose forecast crossed the threshold or moved by more than the delta,
+            alerts of the other cells are not checked again.
+            """
+            cell_size = settings["forecast_cell_size"]
+            changed_at = datetime.now(UTC)
+            changed_cells = 0
+
+            for cells in itertools.batched(
+                await get_cells_to_check(async_session, cell_size, slot), settings["forecast_batch_size"]
+            ):
+                locations = {(x, y): get_cell_center(x, y, cell_size) for x, y in cells}
+                avg_temperatures = await grid_forecast_api.get_avg_temperatures(
+                    list(locations.values()), WEATHER_FORECAST_DAYS
+                )
+                decisions = {
+                    (decision.x, decision.y): decision
+                    for decision in await get_cell_decisions(async_session, list(cells))
+                }
+                changed_decisions = []
+
+                for (x, y), location in locations.items():
+                    avg_temperature = avg_temperatures.get(get_location_key(location))
+
+                    if avg_temperature is None:
+                        continue
+
+                    tire_type = get_tire_type_by_avg_temperature(avg_temperature)
+                    decision = decisions.get((x, y))
+
+                    if (
+                        decision is not None
+                        and decision.tire_type == tire_type
+                        and abs(decision.avg_temperature - avg_temperature) <= settings["temperature_delta"]
+                    ):
+                        continue
+
+                    changed_decisions.append(
+                        CellDecision(
+                            x=x, y=y, avg_temperature=avg_temperature, tire_type=tire_type, changed_at=changed_at
+                        )
+                    )
+
+                await save_cell_decisions(async_session, changed_decisions)
+                changed_cells += len(changed_decisions)
+
+            logger.info("Forecasts of %s grid cells changed in the alerts check %s", changed_cells, run.slot_key)
+
+        def decide_alerts(alerts: list[AlertRecord], daily_temperatures: dict[LocationKey, DailyTemperatures]):
+            """
+            Decide whether the chats should switch their tires, once for every grid cell of the batch.
+            """
+            cell_indices: dict[LocationKey, int] = {}
+            forecasts = []
+            forecast_indices = []
+
+            for alert in alerts:
+                location = get_chat_location(alert)
+                cell = get_location_key(get_location_cell(location, settings["forecast_cell_size"]))
+
+                if cell not in cell_indices and get_location_key(location) in daily_temperatures:
+                    cell_indices[cell] = len(forecasts)
+                    forecasts.append(daily_temperatures[get_location_key(location)])
+
+                forecast_indices.append(cell_indices.get(cell))
+
+            tire_switches = decide_tire_switches(*pack_daily_temperatures(forecasts), settings["tire_decision_rules"])
+            decided = [(alert, index) for alert, index in zip(alerts, forecast_indices) if index is not None]
+            switches = get_chat_switches(
+                tire_switches, [index for _, index in decided], [alert.tire_type for alert, _ in decided]
             )
-            tire_type = get_tire_type_by_avg_temperature(avg_temperature)
+            decided_switches = {alert.id: switch for (alert, _), switch in zip(decided, switches)}
 
-            if tire_type == chat.tire_type:
-                continue
+            for alert, index in zip(alerts, forecast_indices):
+                if index is None:
+                    yield alert, None, False
+                else:
+                    yield alert, tire_switches.avg_temperatures[index], decided_switches[alert.id]
 
-            await send_alert(alert, avg_temperature)
+        async def get_alerts_to_send():
+            async for alerts in batched(
+                get_alerts_to_check(
+                    async_session, settings["page_size"], slot, claim_timeout, settings["forecast_cell_size"]
+                ),
+                settings["forecast_batch_size"],
+            ):
+                daily_temperatures = await grid_forecast_api.get_many_daily_temperatures(
+                    [get_chat_location(alert) for alert in alerts], WEATHER_FORECAST_DAYS
+                )
+                alerts_to_send = []
 
-    return check_for_alerts
+                for alert, avg_temperature, switch in decide_alerts(alerts, daily_temperatures):
+                    if avg_temperature is None:
+                        logger.warning("The forecast is not available for chat %s", alert.chat_id)
+                        await checkpoint.skipped(alert)
+                    elif not switch:
+                        await checkpoint.skipped(alert)
+                    else:
+                        alerts_to_send.append((alert, avg_temperature))
+
+                async for item in reserve_deliveries(alerts_to_send):
+                    yield item
+
+        async def get_alerts_to_send_again():
+            async for alerts in batched(
+                get_alerts_to_resend(async_session, settings["page_size"], slot, claim_timeout),
+                settings["update_batch_size"],
+            ):
+                async for item in reserve_deliveries([(alert, None) for alert in alerts]):
+                    yield item
+
+        async def reserve_deliveries(items: list[tuple[AlertRecord, float | None]]):
+            sent_chat_ids = await reserve_alert_deliveries(async_session, run.day, [alert for alert, _ in items])
+
+            for alert, avg_temperature in items:
+                if alert.chat_id in sent_chat_ids:
+                    # sent before the run was interrupted, only its update was not saved
+                    await checkpoint.sent(alert)
+                else:
+                    yield alert, avg_temperature
+
+        async def deliver_alert(item: tuple[AlertRecord, float | None]):
+            alert, avg_temperature = item
+
+            if await send_alert(alert, avg_temperature):
+                # confirmed right away and even when the check is cancelled, so a resumed check does not send it again
+                await asyncio.shield(confirm_alert_delivery(async_session, run.day, alert))
+                await checkpoint.sent(alert)
+            else:
+                await checkpoint.failed(alert)
+
+        await run_concurrently(
+            get_alerts_to_send_again(),
+            deliver_alert,
+            settings["workers"],
+            settings["task_timeout"],
+        )
+        # expired alerts are reset by the flush and checked again below
+        await checkpoint.flush()
+
+        await evaluate_cells()
+        await run_concurrently(
+            get_alerts_to_send(),
+            deliver_alert,
+            settings["workers"],
+            settings["task_timeout"],
+        )
+        await checkpoint.flush()
+
+        if not await finish_alert_run(async_session, run):
+            logger.warning(
+                "The alerts check %s of %s has unprocessed alerts, it will be resumed", run.slot_key, run.day
+            )
+
+    return sweep_alerts
 
 
 def send_alert_factory(
     bot: Bot,
     messages: ChatMessages,
-    db_session: DBSession,
 ):
-    async def send_alert(alert: Alert, avg_temperature: float | None = None):
+    # the concurrency and the flood limits of the requests are handled by the send queue of the bot session
+    async def send_alert(alert: AlertRecord, avg_temperature: float | None = None) -> bool:
         try:
             await bot.send_message(
-                alert.chat.id,
+                alert.chat_id,
                 messages.alert_change_tire_type(alert.type, alert.count, avg_temperature),
                 disable_notification=True,
                 reply_markup=ReplyKeyboardMarkup(
@@ -80,15 +389,11 @@ def send_alert_factory(
                 ),
             )
 
-            async_session = await db_session()
-
-            if is_alert_expired(alert):
-                await update_tire_type(async_session, alert.chat_id)
-            else:
-                await increment_alert_counter(async_session, alert.id)
+            return True
 
         except Exception as e:
             logger.exception(e)
+            return False
 
     return send_alert
 
@@ -0,0 +1,36 @@
+from collections.abc import Iterator
+from datetime import time
+
+from database import ChatSlot
+
+# UTC offsets of the time zones derived from the longitude, UTC-12 shares the band of UTC+12
+TIME_ZONES = range(-11, 13)
+
+SECONDS_IN_HOUR = 60 * 60
+SECONDS_IN_DAY = 24 * SECONDS_IN_HOUR
+
+
+def get_alert_schedule(hour: int, local_time: bool, window: float, slots: int) -> Iterator[tuple[time, ChatSlot]]:
+    """
+    Yield the start time and the chats of every daily run of the alerts check.
+    Chats are split into `slots` by id, the runs of the slots are spread over `window` seconds after `hour`.
+    With `local_time` chats are also split by time zone, `hour` is their local time and the start times are in UTC.
+    """
+    for time_zone in TIME_ZONES if local_time else [None]:
+        started_at = (hour - (time_zone or 0)) * SECONDS_IN_HOUR
+
+        for index in range(slots):
+            seconds = int(started_at + index * window / slots) % SECONDS_IN_DAY
+            start = time(seconds // SECONDS_IN_HOUR, seconds % SECONDS_IN_HOUR // 60, seconds % 60)
+
+            yield start, ChatSlot(time_zone, index, slots)
+
+
+def get_prefetch_schedule(hour: int, local_time: bool) -> Iterator[tuple[time, ChatSlot]]:
+    """
+    Yield the start time and the chats of every daily forecast prefetch, one per time zone with `local_time`.
+    """
+    for time_zone in TIME_ZONES if local_time else [None]:
+        start_hour = (hour - (time_zone or 0)) % 24
+
+        yield time(start_hour), ChatSlot(time_zone, 0, 1)
@@ -0,0 +1,71 @@
+import logging
+from datetime import date
+
+from database import DBSession, AlertRecord, update_sent_alerts
+
+from .helpers import is_alert_expired
+
+logger = logging.getLogger(__name__)
+
+
+class AlertsCheckpoint:
+    """
+    Collects the alerts processed during an alerts check and flushes counter increments, expirations
+    and the progress of the check to the database in batches instead of a transaction per alert.
+    Alerts processed but not flushed yet are claimed again when the check is resumed after a crash.
+    """
+
+    def __init__(self, db_session: DBSession, batch_size: int, day: date) -> None:
+        self.db_session = db_session
+        self.batch_size = batch_size
+        self.day = day
+        self.incremented_alert_ids: list[int] = []
+        self.expired_chat_ids: list[int] = []
+        self.swept_alert_ids: list[int] = []
+        self.released_deliveries: list[tuple[int, date, int]] = []
+
+    async def sent(self, alert: AlertRecord) -> None:
+        if is_alert_expired(alert):
+            # the expired alert is reset and checked again, so it is not swept
+            self.expired_chat_ids.append(alert.chat_id)
+        else:
+            self.incremented_alert_ids.append(alert.id)
+            self.swept_alert_ids.append(alert.id)
+
+        await self.flush_full()
+
+    async def failed(self, alert: AlertRecord) -> None:
+        # the alert is sent again by the check of the next day
+        self.released_deliveries.append((alert.chat_id, self.day, alert.type))
+        self.swept_alert_ids.append(alert.id)
+
+        await self.flush_full()
+
+    async def skipped(self, alert: AlertRecord) -> None:
+        self.swept_alert_ids.append(alert.id)
+
+        await self.flush_full()
+
+    async def flush_full(self) -> None:
+        if len(self.swept_alert_ids) + len(self.expired_chat_ids) >= self.batch_size:
+            await self.flush()
+
+    async def flush(self) -> None:
+        incremented_alert_ids, self.incremented_alert_ids = self.incremented_alert_ids, []
+        expired_chat_ids, self.expired_chat_ids = self.expired_chat_ids, []
+        swept_alert_ids, self.swept_alert_ids = self.swept_alert_ids, []
+        released_deliveries, self.released_deliveries = self.released_deliveries, []
+
+        if not swept_alert_ids and not expired_chat_ids:
+            return
+
+        try:
+            await update_sent_alerts(
+                await self.db_session(),
+                incremented_alert_ids,
+                expired_chat_ids,
+                swept_alert_ids,
+                released_deliveries,
+            )
+        except Exception as e:
+            logger.exception(e)
@@ -1,13 +1,13 @@
-from database import Chat, Alert
+from database import Chat, Alert, AlertRecord
 from location import Location
 
 
-def get_chat_location(chat: Chat) -> Location:
+def get_chat_location(chat: Chat | AlertRecord) -> Location:
     return Location(lat=chat.lat, lon=chat.lon)
 
 
 ALERT_EXPIRATION_COUNT = 3
 
 
-def is_alert_expired(alert: Alert) -> bool:
+def is_alert_expired(alert: Alert | AlertRecord) -> bool:
     return alert.count >= ALERT_EXPIRATION_COUNT
@@ -34,9 +34,13 @@ class ChatMessages:
         return (
             "Please, select the way how you want to set your location:\n"
             "- 📍 Coordinates - latitude and longitude\n"
-            "- 🏠 Place - location name"
+            "- 🏠 Place - location name\n"
+            "- 📡 Share location - send your current location from Telegram"
         )
 
+    def settings_location_share_button(self):
+        return "📡 Share location"
+
     def settings_location_coordinates(self):
         return (
             "📍 Enter the the coordinates of your location\n"
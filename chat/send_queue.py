@@ -0,0 +1,132 @@
+import asyncio
+import logging
+import time
+from typing import TypedDict
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import Response, TelegramMethod
+from aiogram.methods.base import TelegramType
+
+from common import LRUCache, TokenBucket
+
+logger = logging.getLogger(__name__)
+
+
+class TelegramSendSettings(TypedDict):
+    # number of requests sent concurrently
+    workers: int
+    # requests per second allowed for the bot in total
+    rate_limit: float
+    # requests per second allowed to a private chat and to a group chat
+    chat_rate_limit: float
+    group_rate_limit: float
+    # number of retries of a request rejected with RetryAfter
+    max_retries: int
+
+
+type SendJob = tuple[NextRequestMiddlewareType, Bot, TelegramMethod, asyncio.Future]
+
+# per-chat buckets refill within seconds, so the ones of inactive chats can be dropped
+CHAT_BUCKETS_SIZE = 10000
+CHAT_BUCKETS_TTL = 60
+
+
+class TelegramSendQueue(BaseRequestMiddleware):
+    """
+    Request middleware of the bot session which sends the requests addressed to a chat through a queue,
+    served by `workers` tasks within the global and per-chat flood limits of Telegram.
+    Requests rejected with RetryAfter pause all workers for the server-provided delay and are retried.
+    Requests which are not addressed to a chat, like polling for updates, are sent directly.
+    """
+
+    def __init__(self, settings: TelegramSendSettings) -> None:
+        self.settings = settings
+        self.queue: asyncio.Queue[SendJob] = asyncio.Queue()
+        self.bucket = TokenBucket(settings["rate_limit"], capacity=settings["rate_limit"])
+        self.chat_buckets: LRUCache[int | str, TokenBucket] = LRUCache(CHAT_BUCKETS_SIZE, CHAT_BUCKETS_TTL)
+        self.resume_at = 0.0
+        self.workers: list[asyncio.Task] = []
+
+    def start(self) -> None:
+        self.workers = [asyncio.create_task(self.work()) for _ in range(self.settings["workers"])]
+
+    async def stop(self) -> None:
+        for worker in self.workers:
+            worker.cancel()
+
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+
+        while not self.queue.empty():
+            *_, future = self.queue.get_nowait()
+            future.cancel()
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        if getattr(method, "chat_id", None) is None or not self.workers:
+            return await make_request(bot, method)
+
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((make_request, bot, method, future))
+
+        return await future
+
+    async def work(self) -> None:
+        while True:
+            make_request, bot, method, future = await self.queue.get()
+
+            # the caller is gone, e.g. the alert task timed out
+            if future.done():
+                continue
+
+            try:
+                future.set_result(await self.send(make_request, bot, method))
+            except asyncio.CancelledError:
+                future.cancel()
+                raise
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+
+    async def send(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        chat_bucket = self.get_chat_bucket(method.chat_id)
+
+        for retry in range(self.settings["max_retries"] + 1):
+            await chat_bucket.acquire()
+            await asyncio.sleep(max(0.0, self.resume_at - time.monotonic()))
+            await self.bucket.acquire()
+
+            try:
+                return await make_request(bot, method)
+
+            except TelegramRetryAfter as e:
+                if retry == self.settings["max_retries"]:
+                    raise
+
+                logger.warning(f"Telegram flood limit exceeded, retrying in {e.retry_after} seconds")
+                self.resume_at = max(self.resume_at, time.monotonic() + e.retry_after)
+
+    def get_chat_bucket(self, chat_id: int | str) -> TokenBucket:
+        bucket = self.chat_buckets.get(chat_id)
+
+        if bucket is None:
+            # group and channel ids are negative or usernames
+            is_private = isinstance(chat_id, int) and chat_id > 0
+            rate_limit = self.settings["chat_rate_limit"] if is_private else self.settings["group_rate_limit"]
+            bucket = TokenBucket(rate_limit)
+
+        # the bucket is set on every use, so its ttl counts from the last request to the chat
+        self.chat_buckets.set(chat_id, bucket)
+
+        return bucket
@@ -1,5 +1,5 @@
 from aiogram import F, Router
-from aiogram.filters import CommandStart, Command
+from aiogram.filters import CommandStart, Command, StateFilter
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.types import KeyboardButton, Message, ReplyKeyboardMarkup, ReplyKeyboardRemove
@@ -35,6 +35,19 @@ class Confirmation:
     No = "no"
 
 
+def build_location_keyboard(messages: ChatMessages) -> ReplyKeyboardMarkup:
+    return ReplyKeyboardMarkup(
+        keyboard=[
+            [
+                KeyboardButton(text=LocationSettingType.Coordinates.capitalize()),
+                KeyboardButton(text=LocationSettingType.Place.capitalize()),
+            ],
+            [KeyboardButton(text=messages.settings_location_share_button(), request_location=True)],
+        ],
+        resize_keyboard=True,
+    )
+
+
 @settings_router.message(CommandStart())
 async def command_start_handler(
     message: Message, state: FSMContext, messages: ChatMessages, location_api: LocationAPI, db_session: DBSession
@@ -57,15 +70,7 @@ async def command_start_handler(
     await state.set_state(Settings.location)
     await message.answer(
         messages.settings_start(),
-        reply_markup=ReplyKeyboardMarkup(
-            keyboard=[
-                [
-                    KeyboardButton(text=LocationSettingType.Coordinates.capitalize()),
-                    KeyboardButton(text=LocationSettingType.Place.capitalize()),
-                ]
-            ],
-            resize_keyboard=True,
-        ),
+        reply_markup=build_location_keyboard(messages),
     )
 
 
@@ -105,12 +110,30 @@ async def process_configure_settings(message: Message, state: FSMContext, messag
     await state.set_state(Settings.location)
     await message.answer(
         messages.settings_location(),
+        reply_markup=build_location_keyboard(messages),
+    )
+
+
+# Shared location holds the exact coordinates, so it is accepted at any step of the location settings
+@settings_router.message(
+    StateFilter(Settings.location, Settings.coordinates_location, Settings.place_location),
+    F.location,
+)
+async def process_shared_location(
+    message: Message, state: FSMContext, messages: ChatMessages, location_api: LocationAPI
+) -> None:
+    location = {"lat": message.location.latitude, "lon": message.location.longitude}
+
+    place_name = await location_api.get_place_name(location)
+
+    await state.update_data(location=location)
+    await state.set_state(Settings.location_confirmation)
+
+    await message.answer(
+        messages.settings_location_confirmation(place_name),
         reply_markup=ReplyKeyboardMarkup(
             keyboard=[
-                [
-                    KeyboardButton(text=LocationSettingType.Coordinates.capitalize()),
-                    KeyboardButton(text=LocationSettingType.Place.capitalize()),
-                ]
+                [KeyboardButton(text=Confirmation.Yes.capitalize()), KeyboardButton(text=Confirmation.No.capitalize())]
             ],
             resize_keyboard=True,
         ),
@@ -215,15 +238,7 @@ async def process_location_confirmation_disagreement(
     await state.set_state(Settings.location)
     await message.answer(
         messages.settings_location(),
-        reply_markup=ReplyKeyboardMarkup(
-            keyboard=[
-                [
-                    KeyboardButton(text=LocationSettingType.Coordinates.capitalize()),
-                    KeyboardButton(text=LocationSettingType.Place.capitalize()),
-                ]
-            ],
-            resize_keyboard=True,
-        ),
+        reply_markup=build_location_keyboard(messages),
     )
 
 
@@ -0,0 +1,121 @@
+import asyncio
+import hashlib
+import logging
+import signal
+from typing import Any, TypedDict
+from urllib.parse import urlparse
+
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+
+class WebhookSettings(TypedDict):
+    # public https url Telegram sends the updates to, the bot polls for updates when it is empty
+    url: str
+    # address the update server listens on
+    host: str
+    port: int
+    # secret token Telegram sends with every update, derived from the bot token when empty
+    secret_token: str
+    # number of processes serving the port
+    workers: int
+    # number of connections Telegram opens to the server at once
+    max_connections: int
+    # number of updates accepted but not handled yet in a process, and of updates handled at once
+    queue_size: int
+    handlers: int
+
+
+type UpdateJob = tuple[Bot, dict[str, Any]]
+
+
+def get_webhook_secret_token(bot: Bot, settings: WebhookSettings) -> str:
+    return settings["secret_token"] or hashlib.sha256(bot.token.encode()).hexdigest()
+
+
+class QueuedRequestHandler(SimpleRequestHandler):
+    """
+    Webhook request handler which answers Telegram as soon as the update is queued,
+    the queue is served by `handlers` tasks of the dispatcher.
+    When the queue is full the request waits for a free place, so a burst of updates slows Telegram down
+    instead of piling up handler tasks.
+    """
+
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, settings: WebhookSettings, **data: Any) -> None:
+        super().__init__(
+            dispatcher, bot, handle_in_background=True, secret_token=get_webhook_secret_token(bot, settings), **data
+        )
+        self.settings = settings
+        self.queue: asyncio.Queue[UpdateJob] = asyncio.Queue(settings["queue_size"])
+        self.handlers: list[asyncio.Task] = []
+
+    def start(self) -> None:
+        self.handlers = [asyncio.create_task(self.work()) for _ in range(self.settings["handlers"])]
+
+    async def close(self) -> None:
+        # updates accepted before the shutdown are handled, Telegram does not send them again
+        await self.queue.join()
+
+        for handler in self.handlers:
+            handler.cancel()
+
+        await asyncio.gather(*self.handlers, return_exceptions=True)
+        self.handlers = []
+
+        await super().close()
+
+    async def _handle_request_background(self, bot: Bot, request: web.Request) -> web.Response:
+        await self.queue.put((bot, await request.json(loads=bot.session.json_loads)))
+
+        return web.json_response({}, dumps=bot.session.json_dumps)
+
+    async def work(self) -> None:
+        while True:
+            bot, update = await self.queue.get()
+
+            try:
+                await self._background_feed_update(bot, update)
+            except Exception:
+                logger.exception("Failed to handle the update %s", update.get("update_id"))
+            finally:
+                self.queue.task_done()
+
+
+async def run_webhook(bot: Bot, dispatcher: Dispatcher, settings: WebhookSettings, set_webhook: bool = True) -> None:
+    """
+    Serve the updates of the bot until the process is interrupted or terminated.
+    Several processes can serve the same port, only one of them should set the webhook.
+    """
+    app = web.Application()
+    handler = QueuedRequestHandler(dispatcher, bot, settings)
+    handler.register(app, path=urlparse(settings["url"]).path or "/")
+    setup_application(app, dispatcher, bot=bot)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, settings["host"], settings["port"], reuse_port=settings["workers"] > 1).start()
+    handler.start()
+
+    if set_webhook:
+        await bot.set_webhook(
+            settings["url"],
+            secret_token=get_webhook_secret_token(bot, settings),
+            max_connections=settings["max_connections"],
+            allowed_updates=dispatcher.resolve_used_update_types(),
+        )
+
+    logger.info("Serving updates on %s:%s", settings["host"], settings["port"])
+
+    stopped = asyncio.Event()
+    loop = asyncio.get_running_loop()
+
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stopped.set)
+
+    try:
+        await stopped.wait()
+    finally:
+        await runner.cleanup()
@@ -0,0 +1,5 @@
+from .http_client import HTTPClientSettings, create_http_client  # noqa
+from .concurrency import run_concurrently, batched  # noqa
+from .lru_cache import LRUCache  # noqa
+from .rate_limiter import TokenBucket  # noqa
+from .single_flight import SingleFlight  # noqa
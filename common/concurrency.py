@@ -0,0 +1,53 @@
+import asyncio
+import logging
+from collections.abc import AsyncIterable, AsyncIterator, Awaitable, Callable
+
+logger = logging.getLogger(__name__)
+
+type Handler[T] = Callable[[T], Awaitable[None]]
+
+
+async def run_concurrently[T](items: AsyncIterable[T], handler: Handler[T], workers: int, timeout: float | None = None):
+    """
+    Run the handler for every item with at most `workers` handlers in flight.
+    A handler that fails or exceeds the timeout is logged and does not stop the others.
+    """
+    queue: asyncio.Queue[T] = asyncio.Queue(maxsize=workers)
+
+    async def worker() -> None:
+        while True:
+            item = await queue.get()
+            try:
+                async with asyncio.timeout(timeout):
+                    await handler(item)
+            except Exception as e:
+                logger.exception(e)
+            finally:
+                queue.task_done()
+
+    tasks = [asyncio.create_task(worker()) for _ in range(workers)]
+
+    try:
+        async for item in items:
+            await queue.put(item)
+
+        await queue.join()
+    finally:
+        for task in tasks:
+            task.cancel()
+
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def batched[T](items: AsyncIterable[T], size: int) -> AsyncIterator[list[T]]:
+    batch = []
+
+    async for item in items:
+        batch.append(item)
+
+        if len(batch) == size:
+            yield batch
+            batch = []
+
+    if batch:
+        yield batch
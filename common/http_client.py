@@ -0,0 +1,27 @@
+from typing import TypedDict
+
+from httpx import AsyncClient, Limits, Timeout
+
+
+class HTTPClientSettings(TypedDict):
+    max_connections: int
+    max_keepalive_connections: int
+    keepalive_expiry: float
+    timeout: float
+
+
+def create_http_client(settings: HTTPClientSettings, headers: dict | None = None) -> AsyncClient:
+    """
+    Create a long-lived client with a connection pool, so the provider APIs
+    reuse connections instead of making a new TCP+TLS handshake per request.
+    The client should be closed with `aclose` on shutdown.
+    """
+    return AsyncClient(
+        headers=headers,
+        timeout=Timeout(settings["timeout"]),
+        limits=Limits(
+            max_connections=settings["max_connections"],
+            max_keepalive_connections=settings["max_keepalive_connections"],
+            keepalive_expiry=settings["keepalive_expiry"],
+        ),
+    )
@@ -0,0 +1,38 @@
+import asyncio
+import time
+
+
+class TokenBucket:
+    """
+    Allows `rate` acquisitions per second with bursts of up to `capacity`.
+    Waiting acquisitions reserve their tokens in advance, so they are served in order.
+    """
+
+    def __init__(self, rate: float, capacity: float = 1) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def get_delay(self) -> float:
+        self.refill()
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+    async def acquire(self, max_wait: float | None = None) -> bool:
+        """
+        Wait for a token, return False without waiting when it is not available within `max_wait` seconds.
+        """
+        delay = self.get_delay()
+
+        if max_wait is not None and delay > max_wait:
+            return False
+
+        self.tokens -= 1
+        await asyncio.sleep(delay)
+
+        return True
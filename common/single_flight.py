@@ -0,0 +1,30 @@
+import asyncio
+from collections.abc import Awaitable, Callable, Hashable
+
+
+class SingleFlight[V]:
+    """
+    Coalesces concurrent calls with the same key, so they share a single in-flight call.
+    """
+
+    def __init__(self) -> None:
+        self.calls: dict[Hashable, asyncio.Future[V]] = {}
+
+    async def run(self, key: Hashable, call: Callable[[], Awaitable[V]]) -> V:
+        if key not in self.calls:
+            task = asyncio.ensure_future(call())
+
+            def remove_call(_: asyncio.Future[V]) -> None:
+                # a forgotten call may have been replaced by a newer one with the same key
+                if self.calls.get(key) is task:
+                    del self.calls[key]
+
+            task.add_done_callback(remove_call)
+            self.calls[key] = task
+
+        # the call is shared with other callers, so it must survive a cancelled caller
+        return await asyncio.shield(self.calls[key])
+
+    def forget(self, key: Hashable) -> None:
+        # later callers start a new call instead of joining the in-flight one
+        self.calls.pop(key, None)
@@ -1,3 +1,7 @@
-from .models import Base, Chat, Alert  # noqa
-from .engine import DBEngine, DBSession  # noqa
+from .models import Base, Chat, Alert, AlertRun, AlertDelivery, CellDecision, Forecast, PlaceName, FSMState  # noqa
+from .records import AlertRecord, ChatSlot  # noqa
+from .engine import DBEngine, DBEngineSettings, DBSession  # noqa
 from .queries import *  # noqa
+from .forecast_storage import DBForecastStorage  # noqa
+from .place_name_storage import DBPlaceNameStorage  # noqa
+from .fsm_storage import DBFSMStorage, FSMStorageSettings  # noqa
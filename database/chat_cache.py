@@ -0,0 +1,43 @@
+from collections.abc import Awaitable, Callable, Iterable
+
+from common import LRUCache, SingleFlight
+
+from .models import Chat
+
+
+class ChatCache:
+    """
+    Read-through cache of chats by id, concurrent misses of the same chat share a single query.
+    The cache is per process, so chats changed by other processes are served stale until `ttl` expires.
+    """
+
+    def __init__(self, maxsize: int, ttl: float) -> None:
+        self.cache: LRUCache[int, Chat] = LRUCache(maxsize, ttl)
+        self.calls: SingleFlight[Chat | None] = SingleFlight()
+        # bumped on every invalidation, so a query started before it does not cache a stale chat
+        self.version = 0
+
+    async def get(self, chat_id: int, load: Callable[[], Awaitable[Chat | None]]) -> Chat | None:
+        chat = self.cache.get(chat_id)
+
+        if chat is not None:
+            return chat
+
+        return await self.calls.run(chat_id, lambda: self.load(chat_id, load))
+
+    async def load(self, chat_id: int, load: Callable[[], Awaitable[Chat | None]]) -> Chat | None:
+        version = self.version
+        chat = await load()
+
+        # chats which are not configured yet are not cached, they are about to be created
+        if chat is not None and version == self.version:
+            self.cache.set(chat_id, chat)
+
+        return chat
+
+    def invalidate(self, chat_ids: Iterable[int]) -> None:
+        self.version += 1
+
+        for chat_id in chat_ids:
+            self.cache.delete(chat_id)
+            self.calls.forget(chat_id)
@@ -1,27 +1,76 @@
+import logging
+from typing import TypedDict
+
+from sqlalchemy import make_url
 from sqlalchemy.ext.asyncio import AsyncEngine
 from sqlalchemy.ext.asyncio import create_async_engine
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.ext.asyncio import async_sessionmaker
 
-from .models import Base
+from .migrations import apply_migrations
+from .chat_cache import ChatCache
 
 type DBSession = async_sessionmaker[AsyncSession]
 
 
+class DBEngineSettings(TypedDict):
+    # number of connections kept in the pool and allowed above it under load
+    pool_size: int
+    max_overflow: int
+    # seconds after which a connection is replaced
+    pool_recycle: float
+    # check connections before they are handed out
+    pool_pre_ping: bool
+    # number of prepared statements cached per asyncpg connection, 0 disables the cache
+    statement_cache_size: int
+    # level of the SQL statements log, INFO logs every statement
+    log_level: str
+    # number of chats and seconds they are kept in the in-process chat cache
+    chat_cache_size: int
+    chat_cache_ttl: float
+
+
 class DBEngine:
 
     engine: AsyncEngine
+    session_factory: DBSession
+    chat_cache: ChatCache
+
+    def __init__(self, db_url: str, settings: DBEngineSettings) -> None:
+        url = make_url(db_url)
+        connect_args = {}
+        pool_args = {}
+
+        if url.get_driver_name() == "asyncpg":
+            # SQLAlchemy and asyncpg keep separate caches of prepared statements, both follow the setting
+            connect_args["prepared_statement_cache_size"] = settings["statement_cache_size"]
+            connect_args["statement_cache_size"] = settings["statement_cache_size"]
+
+        # SQLite connections are not pooled by size, its pool classes reject the sizing arguments
+        if url.get_backend_name() != "sqlite":
+            pool_args["pool_size"] = settings["pool_size"]
+            pool_args["max_overflow"] = settings["max_overflow"]
+
+        self.engine = create_async_engine(
+            db_url,
+            pool_recycle=settings["pool_recycle"],
+            pool_pre_ping=settings["pool_pre_ping"],
+            connect_args=connect_args,
+            **pool_args,
+        )
+        logging.getLogger("sqlalchemy.engine").setLevel(settings["log_level"])
 
-    def __init__(self, db_url: str) -> None:
-        print(db_url)
-        self.engine = create_async_engine(db_url, echo=True)
+        self.chat_cache = ChatCache(settings["chat_cache_size"], settings["chat_cache_ttl"])
+        self.session_factory = async_sessionmaker(
+            self.engine, expire_on_commit=False, info={"chat_cache": self.chat_cache}
+        )
 
-    async def create_all(self) -> None:
+    async def migrate(self) -> None:
         async with self.engine.begin() as connection:
-            await connection.run_sync(Base.metadata.create_all)
+            await connection.run_sync(apply_migrations)
 
     async def dispose(self) -> None:
         await self.engine.dispose()
 
     async def get_db_session(self) -> DBSession:
-        return async_sessionmaker(self.engine, expire_on_commit=False)
+        return self.session_factory
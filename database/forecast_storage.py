@@ -0,0 +1,39 @@
+from datetime import UTC, datetime
+
+from location import LocationKey
+from weather_forecast import ForecastStorage, StoredForecast, DailyTemperatures
+
+from .engine import DBSession
+from .models import Forecast
+from .queries import get_forecasts, replace_forecasts
+
+
+class DBForecastStorage(ForecastStorage):
+    def __init__(self, db_session: DBSession) -> None:
+        self.db_session = db_session
+
+    async def get_forecasts(
+        self, cells: list[LocationKey], fetched_after: datetime
+    ) -> dict[LocationKey, StoredForecast]:
+        forecasts = await get_forecasts(await self.db_session(), cells, fetched_after)
+
+        stored_forecasts = {}
+        for forecast in forecasts:
+            stored_forecast = stored_forecasts.setdefault(
+                (forecast.lat, forecast.lon),
+                # backends without time zone support return naive UTC timestamps
+                {"fetched_at": forecast.fetched_at.replace(tzinfo=UTC), "daily_temperatures": {}},
+            )
+            stored_forecast["daily_temperatures"][forecast.day] = forecast.avg_temperature
+
+        return stored_forecasts
+
+    async def save_forecasts(self, forecasts: dict[LocationKey, DailyTemperatures], fetched_at: datetime) -> None:
+        await replace_forecasts(
+            await self.db_session(),
+            [
+                Forecast(lat=lat, lon=lon, day=day, avg_temperature=avg_temperature, fetched_at=fetched_at)
+                for (lat, lon), daily_temperatures in forecasts.items()
+                for day, avg_temperature in daily_temperatures.items()
+            ],
+        )
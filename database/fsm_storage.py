@@ -0,0 +1,114 @@
+import asyncio
+import copy
+import logging
+import time
+from collections.abc import Mapping
+from datetime import UTC, datetime, timedelta
+from typing import Any, TypedDict
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, StateType, StorageKey
+
+from .engine import DBSession
+from .queries import delete_expired_fsm_states, get_fsm_state, save_fsm_states
+
+logger = logging.getLogger(__name__)
+
+# Expired states are deleted by the process which saves states, at most once per interval.
+CLEANUP_INTERVAL = 60 * 60
+
+
+class FSMStorageSettings(TypedDict):
+    # seconds a state is kept after its last change
+    ttl: float
+    # seconds changes of a state are collected in memory before they are saved together
+    write_delay: float
+
+
+class DBFSMStorage(BaseStorage):
+    """
+    FSM storage keeping the state of every chat in the `fsm_state` table, so any bot process can continue
+    a conversation. Changes made while handling an update are saved together after `write_delay` seconds,
+    until then the process reads them from memory.
+    """
+
+    def __init__(self, db_session: DBSession, settings: FSMStorageSettings) -> None:
+        self.db_session = db_session
+        self.settings = settings
+        self.key_builder = DefaultKeyBuilder(with_bot_id=True, with_business_connection_id=True, with_destiny=True)
+        # changed columns of the states waiting to be saved and of the states being saved
+        self.pending: dict[str, dict[str, Any]] = {}
+        self.saving: dict[str, dict[str, Any]] = {}
+        self.save_task: asyncio.Task | None = None
+        self.save_lock = asyncio.Lock()
+        self.cleaned_at = 0.0
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        self.write(key, "state", state.state if isinstance(state, State) else state)
+
+    async def get_state(self, key: StorageKey) -> str | None:
+        return await self.read(key, "state")
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        self.write(key, "data", copy.deepcopy(dict(data)))
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        return copy.deepcopy(await self.read(key, "data") or {})
+
+    async def close(self) -> None:
+        if self.save_task is not None:
+            self.save_task.cancel()
+            self.save_task = None
+
+        await self.save()
+
+    def write(self, key: StorageKey, column: str, value: Any) -> None:
+        self.pending.setdefault(self.key_builder.build(key), {})[column] = value
+
+        if self.save_task is None:
+            self.save_task = asyncio.create_task(self.save_later())
+
+    async def read(self, key: StorageKey, column: str) -> Any:
+        storage_key = self.key_builder.build(key)
+
+        for values in (self.pending.get(storage_key), self.saving.get(storage_key)):
+            if values is not None and column in values:
+                return values[column]
+
+        fsm_state = await get_fsm_state(await self.db_session(), storage_key, self.get_updated_after())
+        return None if fsm_state is None else getattr(fsm_state, column)
+
+    async def save_later(self) -> None:
+        await asyncio.sleep(self.settings["write_delay"])
+        self.save_task = None
+        await self.save()
+
+    async def save(self) -> None:
+        async with self.save_lock:
+            if not self.pending:
+                return
+
+            self.saving, self.pending = self.pending, {}
+
+            try:
+                await save_fsm_states(await self.db_session(), self.saving, datetime.now(UTC), self.get_updated_after())
+
+                if time.monotonic() - self.cleaned_at >= CLEANUP_INTERVAL:
+                    self.cleaned_at = time.monotonic()
+                    await delete_expired_fsm_states(await self.db_session(), self.get_updated_after())
+
+            except Exception:
+                logger.exception("Failed to save FSM states, retrying in %s seconds", self.settings["write_delay"])
+
+                # changes made since the failed save take precedence
+                for storage_key, values in self.saving.items():
+                    self.pending[storage_key] = values | self.pending.get(storage_key, {})
+
+                if self.save_task is None:
+                    self.save_task = asyncio.create_task(self.save_later())
+
+            finally:
+                self.saving = {}
+
+    def get_updated_after(self) -> datetime:
+        return datetime.now(UTC) - timedelta(seconds=self.settings["ttl"])
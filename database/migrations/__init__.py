@@ -0,0 +1,48 @@
+import logging
+from datetime import UTC, datetime
+
+from sqlalchemy import Column, Connection, DateTime, Integer, MetaData, Table, insert, select
+
+from . import (
+    v0001_initial_schema,
+    v0002_alert_indexes,
+    v0003_alert_swept_at,
+    v0004_alert_runs,
+    v0005_cell_decision,
+    v0006_fsm_state,
+    v0007_alert_slot,
+    v0008_alert_delivery_sent_at,
+)
+
+# Migrations are applied in order, the version of a migration is its position in the list starting from 1.
+# Applied migrations must never be changed, every schema change is a new migration appended to the list.
+MIGRATIONS = [
+    v0001_initial_schema,
+    v0002_alert_indexes,
+    v0003_alert_swept_at,
+    v0004_alert_runs,
+    v0005_cell_decision,
+    v0006_fsm_state,
+    v0007_alert_slot,
+    v0008_alert_delivery_sent_at,
+]
+
+schema_version = Table(
+    "schema_version",
+    MetaData(),
+    Column("version", Integer, primary_key=True),
+    Column("applied_at", DateTime(timezone=True), nullable=False),
+)
+
+
+def apply_migrations(connection: Connection) -> None:
+    schema_version.create(connection, checkfirst=True)
+    applied_versions = set(connection.scalars(select(schema_version.c.version)))
+
+    for version, migration in enumerate(MIGRATIONS, start=1):
+        if version in applied_versions:
+            continue
+
+        logging.info(f"Applying migration {version}: {migration.__name__}")
+        migration.upgrade(connection)
+        connection.execute(insert(schema_version).values(version=version, applied_at=datetime.now(UTC)))
@@ -0,0 +1,46 @@
+from sqlalchemy import Column, Connection, Date, DateTime, Float, ForeignKey, Integer, MetaData, String, Table
+
+# Schema created by `Base.metadata.create_all` before migrations were introduced.
+# Tables are created only when missing, so databases created at startup are adopted as they are.
+
+metadata = MetaData()
+
+Table(
+    "chat",
+    metadata,
+    Column("id", Integer, primary_key=True),
+    Column("lat", Float, nullable=False),
+    Column("lon", Float, nullable=False),
+    Column("tire_type", Integer, nullable=False),
+)
+
+Table(
+    "alert",
+    metadata,
+    Column("id", Integer, primary_key=True),
+    Column("chat_id", Integer, ForeignKey("chat.id"), nullable=False),
+    Column("type", Integer, nullable=False),
+    Column("count", Integer, nullable=False),
+)
+
+Table(
+    "forecast",
+    metadata,
+    Column("lat", Float, primary_key=True),
+    Column("lon", Float, primary_key=True),
+    Column("day", Date, primary_key=True),
+    Column("avg_temperature", Float, nullable=False),
+    Column("fetched_at", DateTime(timezone=True), nullable=False),
+)
+
+Table(
+    "place_name",
+    metadata,
+    Column("lat", Float, primary_key=True),
+    Column("lon", Float, primary_key=True),
+    Column("name", String, nullable=False),
+)
+
+
+def upgrade(connection: Connection) -> None:
+    metadata.create_all(connection, checkfirst=True)
@@ -0,0 +1,34 @@
+from sqlalchemy import Column, Connection, Index, Integer, MetaData, Table, text
+
+# A chat has at most one alert, the unique index also serves the alert upsert `ON CONFLICT (chat_id)`.
+# The alerts check scans new alerts (`count = 0`) and the alerts resend scans sent ones (`count > 0`),
+# both paginated by id, so each scan gets a partial index on id.
+
+alert = Table(
+    "alert",
+    MetaData(),
+    Column("id", Integer, primary_key=True),
+    Column("chat_id", Integer),
+    Column("count", Integer),
+)
+
+indexes = [
+    Index("ix_alert_chat_id", alert.c.chat_id, unique=True),
+    Index(
+        "ix_alert_new_id",
+        alert.c.id,
+        postgresql_where=text("count = 0"),
+        sqlite_where=text("count = 0"),
+    ),
+    Index(
+        "ix_alert_sent_id",
+        alert.c.id,
+        postgresql_where=text("count > 0"),
+        sqlite_where=text("count > 0"),
+    ),
+]
+
+
+def upgrade(connection: Connection) -> None:
+    for index in indexes:
+        index.create(connection, checkfirst=True)
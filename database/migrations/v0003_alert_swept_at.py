@@ -0,0 +1,8 @@
+from sqlalchemy import Connection, DateTime, text
+
+# Alerts claimed by the alerts check are marked with the claim time, so concurrent processes split the sweep.
+
+
+def upgrade(connection: Connection) -> None:
+    column_type = DateTime(timezone=True).compile(dialect=connection.dialect)
+    connection.execute(text(f"ALTER TABLE alert ADD COLUMN swept_at {column_type}"))
@@ -0,0 +1,33 @@
+from sqlalchemy import Column, Connection, Date, DateTime, Integer, MetaData, String, Table, text
+
+# Alerts are leased by the claim and marked as swept once processed, so alerts of a crashed process are claimed again.
+# Runs of the alerts check and reserved deliveries make the check resumable without sending an alert twice.
+
+metadata = MetaData()
+
+Table(
+    "alert_run",
+    metadata,
+    Column("day", Date, primary_key=True),
+    Column("slot_key", String, primary_key=True),
+    Column("time_zone", Integer),
+    Column("slot_index", Integer, nullable=False),
+    Column("slot_count", Integer, nullable=False),
+    Column("started_at", DateTime(timezone=True), nullable=False),
+    Column("finished_at", DateTime(timezone=True)),
+)
+
+Table(
+    "alert_delivery",
+    metadata,
+    Column("chat_id", Integer, primary_key=True),
+    Column("day", Date, primary_key=True),
+    Column("type", Integer, primary_key=True),
+)
+
+
+def upgrade(connection: Connection) -> None:
+    column_type = DateTime(timezone=True).compile(dialect=connection.dialect)
+    connection.execute(text(f"ALTER TABLE alert ADD COLUMN claimed_at {column_type}"))
+
+    metadata.create_all(connection)
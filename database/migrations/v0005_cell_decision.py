@@ -0,0 +1,19 @@
+from sqlalchemy import Column, Connection, DateTime, Float, Integer, MetaData, Table
+
+# The last evaluated forecast of every grid cell, the alerts check skips alerts of cells whose forecast did not change.
+
+metadata = MetaData()
+
+Table(
+    "cell_decision",
+    metadata,
+    Column("x", Integer, primary_key=True),
+    Column("y", Integer, primary_key=True),
+    Column("avg_temperature", Float, nullable=False),
+    Column("tire_type", Integer, nullable=False),
+    Column("changed_at", DateTime(timezone=True), nullable=False),
+)
+
+
+def upgrade(connection: Connection) -> None:
+    metadata.create_all(connection)
@@ -0,0 +1,19 @@
+from sqlalchemy import JSON, Column, Connection, DateTime, Index, MetaData, String, Table
+
+# The conversation state of every chat, so any bot process can continue the settings flow after a restart.
+
+metadata = MetaData()
+
+Table(
+    "fsm_state",
+    metadata,
+    Column("key", String, primary_key=True),
+    Column("state", String),
+    Column("data", JSON(none_as_null=True)),
+    Column("updated_at", DateTime(timezone=True), nullable=False),
+    Index("ix_fsm_state_updated_at", "updated_at"),
+)
+
+
+def upgrade(connection: Connection) -> None:
+    metadata.create_all(connection)
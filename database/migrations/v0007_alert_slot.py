@@ -0,0 +1,64 @@
+import math
+
+from sqlalchemy import Column, Connection, Index, Integer, MetaData, Table, text
+
+# Every alert stores the time zone and the id bucket of its chat, so the alerts check of a slot of chats
+# scans the partial indexes by slot instead of filtering all alerts by the chat longitude and id.
+# The values are computed as of this migration, later changes are made by the chat queries.
+
+TIME_ZONE_WIDTH = 15
+SLOT_BUCKETS = 360
+
+alert = Table(
+    "alert",
+    MetaData(),
+    Column("id", Integer, primary_key=True),
+    Column("count", Integer),
+    Column("time_zone", Integer),
+    Column("slot_bucket", Integer),
+)
+
+indexes = [
+    Index(
+        "ix_alert_new_slot",
+        alert.c.time_zone,
+        alert.c.slot_bucket,
+        alert.c.id,
+        postgresql_where=text("count = 0"),
+        sqlite_where=text("count = 0"),
+    ),
+    Index(
+        "ix_alert_sent_slot",
+        alert.c.time_zone,
+        alert.c.slot_bucket,
+        alert.c.id,
+        postgresql_where=text("count > 0"),
+        sqlite_where=text("count > 0"),
+    ),
+]
+
+
+def get_time_zone(lon: float) -> int:
+    time_zone = math.floor((lon + TIME_ZONE_WIDTH / 2) / TIME_ZONE_WIDTH)
+    return 12 if time_zone == -12 else time_zone
+
+
+def upgrade(connection: Connection) -> None:
+    connection.execute(text("ALTER TABLE alert ADD COLUMN time_zone INTEGER"))
+    connection.execute(text("ALTER TABLE alert ADD COLUMN slot_bucket INTEGER"))
+
+    alerts = connection.execute(
+        text("SELECT alert.id, alert.chat_id, chat.lon FROM alert JOIN chat ON chat.id = alert.chat_id")
+    )
+    values = [
+        {"id": id, "time_zone": get_time_zone(lon), "slot_bucket": abs(chat_id) % SLOT_BUCKETS}
+        for id, chat_id, lon in alerts
+    ]
+
+    if values:
+        connection.execute(
+            text("UPDATE alert SET time_zone = :time_zone, slot_bucket = :slot_bucket WHERE id = :id"), values
+        )
+
+    for index in indexes:
+        index.create(connection, checkfirst=True)
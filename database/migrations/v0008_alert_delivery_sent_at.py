@@ -0,0 +1,11 @@
+from sqlalchemy import Connection, DateTime, text
+
+# Deliveries are reserved before they are sent and confirmed once the message is sent,
+# a resumed alerts check sends the reserved deliveries which were not confirmed again.
+# Deliveries reserved before this migration are taken as sent.
+
+
+def upgrade(connection: Connection) -> None:
+    column_type = DateTime(timezone=True).compile(dialect=connection.dialect)
+    connection.execute(text(f"ALTER TABLE alert_delivery ADD COLUMN sent_at {column_type}"))
+    connection.execute(text("UPDATE alert_delivery SET sent_at = CURRENT_TIMESTAMP"))
@@ -1,4 +1,8 @@
-from sqlalchemy import ForeignKey
+from datetime import date, datetime
+
+from typing import Any
+
+from sqlalchemy import JSON, DateTime, ForeignKey, Index, text
 from sqlalchemy.orm import DeclarativeBase
 from sqlalchemy.orm import Mapped
 from sqlalchemy.orm import mapped_column
@@ -40,8 +44,32 @@ class Chat(Base):
         return f"Chat(id={self.id!r}, [lat={self.latitude!r}, lon={self.fullname!r}])"
 
 
+# Indexes are created by migrations, see `database.migrations`.
+
+
 class Alert(Base):
     __tablename__ = "alert"
+    __table_args__ = (
+        Index("ix_alert_chat_id", "chat_id", unique=True),
+        Index("ix_alert_new_id", "id", postgresql_where=text("count = 0"), sqlite_where=text("count = 0")),
+        Index("ix_alert_sent_id", "id", postgresql_where=text("count > 0"), sqlite_where=text("count > 0")),
+        Index(
+            "ix_alert_new_slot",
+            "time_zone",
+            "slot_bucket",
+            "id",
+            postgresql_where=text("count = 0"),
+            sqlite_where=text("count = 0"),
+        ),
+        Index(
+            "ix_alert_sent_slot",
+            "time_zone",
+            "slot_bucket",
+            "id",
+            postgresql_where=text("count > 0"),
+            sqlite_where=text("count > 0"),
+        ),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
     chat_id: Mapped[int] = mapped_column(ForeignKey("chat.id"))
@@ -55,6 +83,126 @@ class Alert(Base):
 
     count: Mapped[int] = mapped_column()
 
+    # times when the alert was claimed and processed by the last alerts check, see `database.queries.get_alerts_pages`
+    claimed_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True))
+    swept_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True))
+
+    # time zone and id bucket of the chat, the alerts check selects a slot of chats by them,
+    # see `database.queries.get_chat_slot_condition`
+    time_zone: Mapped[int | None] = mapped_column()
+    slot_bucket: Mapped[int | None] = mapped_column()
+
     def __repr__(self) -> str:
         type = self.formatted_type[self.type]
         return f"Alert(id={self.id!r}, chat_id={self.chat_id!r}, type={type!r} count={self.count!r})"
+
+
+# Every scheduled alerts check of a slot of chats is recorded as a run, unfinished runs are resumed after a crash.
+# Alerts are sent at most once a day: a delivery is reserved for the chat, day and alert type before it is sent.
+
+
+class AlertRun(Base):
+    __tablename__ = "alert_run"
+
+    day: Mapped[date] = mapped_column(primary_key=True)
+    slot_key: Mapped[str] = mapped_column(primary_key=True)
+
+    time_zone: Mapped[int | None] = mapped_column()
+    slot_index: Mapped[int] = mapped_column()
+    slot_count: Mapped[int] = mapped_column()
+
+    started_at: Mapped[datetime] = mapped_column(DateTime(timezone=True))
+    finished_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True))
+
+    def __repr__(self) -> str:
+        return f"AlertRun(day={self.day!r}, slot_key={self.slot_key!r}, finished_at={self.finished_at!r})"
+
+
+class AlertDelivery(Base):
+    __tablename__ = "alert_delivery"
+
+    chat_id: Mapped[int] = mapped_column(primary_key=True)
+    day: Mapped[date] = mapped_column(primary_key=True)
+    type: Mapped[int] = mapped_column(primary_key=True)
+
+    # set once the message is sent, reserved deliveries without it are sent again when the check is resumed
+    sent_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True))
+
+    def __repr__(self) -> str:
+        return f"AlertDelivery(chat_id={self.chat_id!r}, day={self.day!r}, type={self.type!r})"
+
+
+# Forecasts are shared by all chats of a grid cell, see `location.get_location_cell`.
+# Every row is the average temperature of a single day, all rows of a cell come from the same provider request.
+
+
+class Forecast(Base):
+    __tablename__ = "forecast"
+
+    lat: Mapped[float] = mapped_column(primary_key=True)
+    lon: Mapped[float] = mapped_column(primary_key=True)
+    day: Mapped[date] = mapped_column(primary_key=True)
+
+    avg_temperature: Mapped[float] = mapped_column()
+    fetched_at: Mapped[datetime] = mapped_column(DateTime(timezone=True))
+
+    def __repr__(self) -> str:
+        return (
+            f"Forecast([lat={self.lat!r}, lon={self.lon!r}], day={self.day!r}, "
+            f"avg_temperature={self.avg_temperature!r})"
+        )
+
+
+# The last evaluated forecast of every grid cell with alerts to check, the cell is identified by its indices
+# `round(lat / cell_size)` and `round(lon / cell_size)`. It changes when the tire type decision flips
+# or the average temperature moves by more than a threshold, alerts of unchanged cells are not checked again.
+
+
+class CellDecision(Base):
+    __tablename__ = "cell_decision"
+
+    x: Mapped[int] = mapped_column(primary_key=True)
+    y: Mapped[int] = mapped_column(primary_key=True)
+
+    avg_temperature: Mapped[float] = mapped_column()
+    tire_type: Mapped[int] = mapped_column()
+    changed_at: Mapped[datetime] = mapped_column(DateTime(timezone=True))
+
+    def __repr__(self) -> str:
+        return (
+            f"CellDecision([x={self.x!r}, y={self.y!r}], avg_temperature={self.avg_temperature!r}, "
+            f"tire_type={self.tire_type!r})"
+        )
+
+
+# Place names are cached by coordinates rounded to the grid cell, see `location.CachedLocationAPI`.
+
+
+class PlaceName(Base):
+    __tablename__ = "place_name"
+
+    lat: Mapped[float] = mapped_column(primary_key=True)
+    lon: Mapped[float] = mapped_column(primary_key=True)
+
+    name: Mapped[str] = mapped_column()
+
+    def __repr__(self) -> str:
+        return f"PlaceName([lat={self.lat!r}, lon={self.lon!r}], name={self.name!r})"
+
+
+# The FSM state of the settings flow of every chat, see `database.DBFSMStorage`.
+# States not updated within the storage ttl are ignored and deleted.
+
+
+class FSMState(Base):
+    __tablename__ = "fsm_state"
+    __table_args__ = (Index("ix_fsm_state_updated_at", "updated_at"),)
+
+    key: Mapped[str] = mapped_column(primary_key=True)
+
+    state: Mapped[str | None] = mapped_column()
+    data: Mapped[dict[str, Any] | None] = mapped_column(JSON(none_as_null=True))
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True))
+
+    def __repr__(self) -> str:
+        return f"FSMState(key={self.key!r}, state={self.state!r})"
@@ -0,0 +1,17 @@
+from location import LocationKey, PlaceNameStorage
+
+from .engine import DBSession
+from .queries import get_place_name, save_place_name
+
+
+class DBPlaceNameStorage(PlaceNameStorage):
+    def __init__(self, db_session: DBSession) -> None:
+        self.db_session = db_session
+
+    async def get_place_name(self, key: LocationKey) -> str | None:
+        lat, lon = key
+        return await get_place_name(await self.db_session(), lat, lon)
+
+    async def save_place_name(self, key: LocationKey, place_name: str) -> None:
+        lat, lon = key
+        await save_place_name(await self.db_session(), lat, lon, place_name)
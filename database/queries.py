@@ -1,74 +1,753 @@
-from collections.abc import AsyncIterator
+from collections.abc import AsyncIterator, Sequence
+from contextlib import asynccontextmanager
+import math
+from collections import defaultdict
+from datetime import UTC, date, datetime, timedelta
+from typing import Any
 
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.ext.asyncio import async_sessionmaker
-from sqlalchemy import select
+from sqlalchemy import (
+    ColumnElement,
+    Integer,
+    and_,
+    case,
+    cast,
+    delete,
+    func,
+    inspect,
+    literal,
+    literal_column,
+    or_,
+    select,
+    true,
+    tuple_,
+    update,
+)
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 
-from weather_forecast import get_opposite_tire_type
+from location import Location
+from weather_forecast import TireType
 
-from .models import Chat, Alert
+from .models import Chat, Alert, AlertRun, AlertDelivery, CellDecision, Forecast, PlaceName, FSMState
+from .records import AlertRecord, ChatSlot
+from .chat_cache import ChatCache
+
+# Conditions of the partial alert indexes, the zero is rendered inline instead of a bound parameter,
+# so the planner matches the indexes for prepared statements as well.
+NEW_ALERT = Alert.count == literal_column("0")
+SENT_ALERT = Alert.count > literal_column("0")
+
+# Every chat is swept once a day, the interval only has to exceed the duration of a sweep and clock skew.
+SWEEP_INTERVAL = timedelta(hours=12)
+# Alerts claimed but not swept within the timeout are claimed again.
+CLAIM_TIMEOUT = timedelta(minutes=15)
+
+# Time zones are derived from the longitude as 15 degree bands centered on the multiples of 15 degrees.
+TIME_ZONE_WIDTH = 15
+# Chats are split into slots by the bucket of their id, a slot of chats is a range of buckets.
+SLOT_BUCKETS = 360
+
+# Session factories which are not built by `DBEngine` do not cache chats.
+NO_CHAT_CACHE = ChatCache(maxsize=0, ttl=0)
+
+
+def get_chat_cache(async_session: async_sessionmaker[AsyncSession]) -> ChatCache:
+    """
+    Chats read by the settings flow are cached per engine, the cache is kept in the info of its session factory.
+    Every query changing a chat or its alert invalidates the cached chat.
+    """
+    return async_session.kw.get("info", {}).get("chat_cache", NO_CHAT_CACHE)
 
 
 async def get_chat_by_id(async_session: async_sessionmaker[AsyncSession], chat_id: int) -> Chat | None:
+    return await get_chat_cache(async_session).get(chat_id, lambda: load_chat_by_id(async_session, chat_id))
+
+
+async def load_chat_by_id(async_session: async_sessionmaker[AsyncSession], chat_id: int) -> Chat | None:
     async with async_session() as session:
         return await session.get(Chat, chat_id)
 
 
 async def create_chat(async_session: async_sessionmaker[AsyncSession], chat: Chat) -> None:
+    assign_alert_slot(chat)
+
     async with async_session() as session:
         session.add(chat)
         await session.commit()
 
+    get_chat_cache(async_session).invalidate([chat.id])
+
 
 async def create_or_update_chat(async_session: async_sessionmaker[AsyncSession], chat: Chat) -> None:
+    assign_alert_slot(chat)
+
     async with async_session() as session:
-        chat_entity = await session.get(Chat, chat.id)
+        if session.get_bind().dialect.name == "postgresql" and await has_alert_chat_index(async_session, session):
+            await session.execute(build_chat_upsert(chat))
+        else:
+            await merge_chat(session, chat)
+
+        await session.commit()
+
+    get_chat_cache(async_session).invalidate([chat.id])
+
+
+async def has_alert_chat_index(async_session: async_sessionmaker[AsyncSession], session: AsyncSession) -> bool:
+    """
+    The upsert conflicts on the unique index of alerts by chat, chats are merged until a migration creates it.
+    Once found, the index is remembered in the info of the session factory.
+    """
+    info = async_session.kw.get("info", {})
+
+    if not info.get("alert_chat_index"):
+        info["alert_chat_index"] = await session.run_sync(
+            lambda sync_session: any(
+                index["name"] == "ix_alert_chat_id" and index["unique"]
+                for index in inspect(sync_session.connection()).get_indexes("alert")
+            )
+        )
+
+    return info["alert_chat_index"]
+
+
+def build_chat_upsert(chat: Chat):
+    """
+    Upsert the chat and its alert in a single statement:
+    the chat is upserted in a CTE and the alert insert selects from it.
+    """
+    chat_upsert = postgresql_insert(Chat).values(id=chat.id, lat=chat.lat, lon=chat.lon, tire_type=chat.tire_type)
+    chat_upsert = (
+        chat_upsert.on_conflict_do_update(
+            index_elements=[Chat.id],
+            set_={
+                "lat": chat_upsert.excluded.lat,
+                "lon": chat_upsert.excluded.lon,
+                "tire_type": chat_upsert.excluded.tire_type,
+            },
+        )
+        .returning(Chat.id)
+        .cte("upserted_chat")
+    )
 
-        if chat_entity is None:
-            return await create_chat(async_session, chat)
+    alert_upsert = postgresql_insert(Alert).from_select(
+        ["chat_id", "type", "count", "time_zone", "slot_bucket"],
+        select(
+            chat_upsert.c.id,
+            literal(chat.alert.type),
+            literal(chat.alert.count),
+            literal(chat.alert.time_zone),
+            literal(chat.alert.slot_bucket),
+        ),
+    )
+    return alert_upsert.on_conflict_do_update(
+        index_elements=[Alert.chat_id],
+        # the reconfigured chat is checked by the next sweep
+        set_={
+            "type": alert_upsert.excluded.type,
+            "count": alert_upsert.excluded.count,
+            "time_zone": alert_upsert.excluded.time_zone,
+            "slot_bucket": alert_upsert.excluded.slot_bucket,
+            "claimed_at": None,
+            "swept_at": None,
+        },
+    )
 
-        chat_entity.lat = chat.lat
-        chat_entity.lon = chat.lon
-        chat_entity.tire_type = chat.tire_type
-        chat_entity.alert.type = chat.alert.type
-        chat_entity.alert.count = chat.alert.count
 
+async def merge_chat(session: AsyncSession, chat: Chat) -> None:
+    # portable fallback for backends without ON CONFLICT support in CTEs
+    chat_entity = await session.get(Chat, chat.id, with_for_update=True)
+
+    if chat_entity is None:
+        session.add(chat)
+        return
+
+    chat_entity.lat = chat.lat
+    chat_entity.lon = chat.lon
+    chat_entity.tire_type = chat.tire_type
+    chat_entity.alert.type = chat.alert.type
+    chat_entity.alert.count = chat.alert.count
+    chat_entity.alert.time_zone = chat.alert.time_zone
+    chat_entity.alert.slot_bucket = chat.alert.slot_bucket
+    chat_entity.alert.claimed_at = None
+    chat_entity.alert.swept_at = None
+
+
+async def get_alerts_to_check(
+    async_session: async_sessionmaker[AsyncSession],
+    page_size: int,
+    slot: ChatSlot | None = None,
+    claim_timeout: timedelta = CLAIM_TIMEOUT,
+    cell_size: float | None = None,
+) -> AsyncIterator[AlertRecord]:
+    """
+    Stream new alerts, with `cell_size` only the ones which may need to be sent since they were checked last time,
+    see `get_changed_cell_condition`.
+    """
+    condition = NEW_ALERT if slot is None else and_(NEW_ALERT, get_chat_slot_condition(slot))
+
+    if cell_size is not None:
+        condition = and_(condition, get_changed_cell_condition(cell_size))
+
+    async for alert in get_alerts_pages(async_session, condition, page_size, claim_timeout):
+        yield alert
+
+
+def get_changed_cell_condition(cell_size: float) -> ColumnElement[bool]:
+    """
+    Alerts which are new or reset, or whose cell changed since they were checked, or whose cell decision
+    differs from the tires of the chat (the alert was not sent yet, e.g. after a failure).
+    Other alerts would be checked with the same result, so they are skipped.
+    """
+    unchanged_cell = (
+        select(CellDecision.x)
+        .where(
+            CellDecision.x == get_cell_index(Chat.lat, cell_size),
+            CellDecision.y == get_cell_index(Chat.lon, cell_size),
+            CellDecision.changed_at <= Alert.swept_at,
+            CellDecision.tire_type == Chat.tire_type,
+        )
+        .exists()
+    )
+    return or_(Alert.swept_at.is_(None), ~unchanged_cell)
+
+
+def get_cell_index(coordinate: ColumnElement[float], cell_size: float) -> ColumnElement[int]:
+    """
+    Integer index of the grid cell, rounded half up the same as `location.get_cell_index`.
+    Being an integer, it is compared with the primary key of cell decisions without a cast,
+    so the decision of a chat is looked up by the key instead of scanning the table.
+    """
+    return cast(func.floor(coordinate / cell_size + 0.5), Integer)
+
+
+async def get_cells_to_check(
+    async_session: async_sessionmaker[AsyncSession], cell_size: float, slot: ChatSlot
+) -> list[tuple[int, int]]:
+    """
+    Indices of the grid cells with new alerts in the slot.
+    """
+    x, y = get_cell_index(Chat.lat, cell_size), get_cell_index(Chat.lon, cell_size)
+
+    async with async_session() as session:
+        cells = await session.execute(
+            select(x, y)
+            .join(Alert, Alert.chat_id == Chat.id)
+            .where(NEW_ALERT, get_chat_slot_condition(slot))
+            .distinct()
+        )
+        return list(cells.tuples())
+
+
+async def get_cell_decisions(
+    async_session: async_sessionmaker[AsyncSession], cells: list[tuple[int, int]]
+) -> list[CellDecision]:
+    async with async_session() as session:
+        decisions = await session.scalars(select(CellDecision).where(tuple_(CellDecision.x, CellDecision.y).in_(cells)))
+        return list(decisions)
+
+
+async def save_cell_decisions(async_session: async_sessionmaker[AsyncSession], decisions: list[CellDecision]) -> None:
+    if not decisions:
+        return
+
+    values = [
+        {
+            "x": decision.x,
+            "y": decision.y,
+            "avg_temperature": decision.avg_temperature,
+            "tire_type": decision.tire_type,
+            "changed_at": decision.changed_at,
+        }
+        for decision in decisions
+    ]
+
+    async with async_session() as session:
+        if session.get_bind().dialect.name == "postgresql":
+            statement = postgresql_insert(CellDecision).values(values)
+        else:
+            statement = sqlite_insert(CellDecision).values(values)
+
+        await session.execute(
+            statement.on_conflict_do_update(
+                index_elements=[CellDecision.x, CellDecision.y],
+                set_={
+                    "avg_temperature": statement.excluded.avg_temperature,
+                    "tire_type": statement.excluded.tire_type,
+                    "changed_at": statement.excluded.changed_at,
+                },
+            )
+        )
         await session.commit()
 
 
-async def get_alerts_to_check(async_session: async_sessionmaker[AsyncSession]) -> AsyncIterator[Alert]:
+async def get_locations_to_check(
+    async_session: async_sessionmaker[AsyncSession], slot: ChatSlot | None = None
+) -> AsyncIterator[Location]:
+    conditions = [NEW_ALERT] if slot is None else [NEW_ALERT, get_chat_slot_condition(slot)]
+
     async with async_session() as session:
-        alerts = await session.execute(select(Alert).where(Alert.count == 0))
-        for alert in alerts.scalars():
+        locations = await session.execute(
+            select(Chat.lat, Chat.lon).join(Alert, Alert.chat_id == Chat.id).where(*conditions).distinct()
+        )
+        for lat, lon in locations:
+            yield {"lat": lat, "lon": lon}
+
+
+async def get_alerts_to_resend(
+    async_session: async_sessionmaker[AsyncSession],
+    page_size: int,
+    slot: ChatSlot | None = None,
+    claim_timeout: timedelta = CLAIM_TIMEOUT,
+) -> AsyncIterator[AlertRecord]:
+    condition = SENT_ALERT if slot is None else and_(SENT_ALERT, get_chat_slot_condition(slot))
+
+    async for alert in get_alerts_pages(async_session, condition, page_size, claim_timeout):
+        yield alert
+
+
+def get_chat_slot_condition(slot: ChatSlot) -> ColumnElement[bool]:
+    """
+    The alerts of a slot of chats, matched by the slot columns of the alert so the scan uses the slot indexes.
+    The slot takes a range of id buckets, so chats are split into any number of slots.
+    """
+    conditions = []
+
+    if slot.time_zone is not None:
+        conditions.append(Alert.time_zone == slot.time_zone)
+
+    if slot.count > 1:
+        conditions.append(Alert.slot_bucket >= get_slot_bucket_start(slot.index, slot.count))
+        conditions.append(Alert.slot_bucket < get_slot_bucket_start(slot.index + 1, slot.count))
+
+    return and_(true(), *conditions)
+
+
+def get_slot_bucket_start(index: int, count: int) -> int:
+    return -(-index * SLOT_BUCKETS // count)
+
+
+def get_time_zone(lon: float) -> int:
+    time_zone = math.floor((lon + TIME_ZONE_WIDTH / 2) / TIME_ZONE_WIDTH)
+    # UTC+12 and UTC-12 share the band around the antimeridian
+    return 12 if time_zone == -12 else time_zone
+
+
+def assign_alert_slot(chat: Chat) -> None:
+    chat.alert.time_zone = get_time_zone(chat.lon)
+    chat.alert.slot_bucket = abs(chat.id) % SLOT_BUCKETS
+
+
+async def get_alerts_pages(
+    async_session: async_sessionmaker[AsyncSession],
+    condition: ColumnElement[bool],
+    page_size: int,
+    claim_timeout: timedelta,
+) -> AsyncIterator[AlertRecord]:
+    """
+    Stream alerts joined with their chats in pages claimed by short transactions, ordered by id.
+    Alerts locked by concurrent claims are skipped, so processes sweeping at the same time split the alerts
+    and every alert is processed by exactly one of them.
+    A claimed alert is leased for `claim_timeout`, it is claimed again when it is not marked as swept by then,
+    so alerts claimed by a crashed process are picked up by the next sweep.
+    Every page continues after the last alert claimed by this sweep, so the partial indexes of alerts by id
+    are range scanned from the cursor instead of from the start of the table.
+    """
+    last_claimed_id = 0
+
+    while True:
+        alerts = await claim_alerts(
+            async_session, and_(condition, Alert.id > last_claimed_id), page_size, claim_timeout
+        )
+
+        for alert in alerts:
             yield alert
 
+        if len(alerts) < page_size:
+            return
+
+        last_claimed_id = alerts[-1].id
+
+
+async def claim_alerts(
+    async_session: async_sessionmaker[AsyncSession],
+    condition: ColumnElement[bool],
+    page_size: int,
+    claim_timeout: timedelta,
+) -> list[AlertRecord]:
+    claimed_at = datetime.now(UTC)
+    claimable_alert_ids = (
+        select(Alert.id)
+        .join(Chat, Chat.id == Alert.chat_id)
+        .where(
+            condition,
+            or_(Alert.swept_at.is_(None), Alert.swept_at < claimed_at - SWEEP_INTERVAL),
+            or_(Alert.claimed_at.is_(None), Alert.claimed_at < claimed_at - claim_timeout),
+        )
+        .order_by(Alert.id)
+        .limit(page_size)
+        .with_for_update(of=Alert, skip_locked=True)
+    )
 
-async def get_alerts_to_resend(async_session: async_sessionmaker[AsyncSession]) -> AsyncIterator[Alert]:
     async with async_session() as session:
-        alerts = await session.execute(select(Alert).where(Alert.count > 0))
-        for alert in alerts.scalars():
-            yield alert
+        claimed_alert_ids = list(
+            await session.scalars(
+                update(Alert)
+                .where(Alert.id.in_(claimable_alert_ids.scalar_subquery()))
+                .values(claimed_at=claimed_at)
+                .returning(Alert.id)
+                .execution_options(synchronize_session=False)
+            )
+        )
 
+        if not claimed_alert_ids:
+            await session.commit()
+            return []
+
+        alerts = await session.execute(
+            select(Alert.id, Alert.type, Alert.count, Alert.chat_id, Chat.lat, Chat.lon, Chat.tire_type)
+            .join(Chat, Chat.id == Alert.chat_id)
+            .where(Alert.id.in_(claimed_alert_ids))
+            .order_by(Alert.id)
+        )
+        await session.commit()
+
+    return [AlertRecord._make(row) for row in alerts]
+
+
+async def start_alert_run(async_session: async_sessionmaker[AsyncSession], day: date, slot: ChatSlot) -> AlertRun:
+    """
+    Get the run of the slot on the day, processes starting the same run concurrently share it.
+    """
+    slot_key = get_chat_slot_key(slot)
 
-async def increment_alert_counter(async_session: async_sessionmaker[AsyncSession], alert_id: int) -> None:
     async with async_session() as session:
-        alert = await session.get(Alert, alert_id)
+        run = await session.get(AlertRun, (day, slot_key))
 
-        if alert is None:
-            return
+        if run is None:
+            values = {
+                "day": day,
+                "slot_key": slot_key,
+                "time_zone": slot.time_zone,
+                "slot_index": slot.index,
+                "slot_count": slot.count,
+                "started_at": datetime.now(UTC),
+            }
+            if session.get_bind().dialect.name == "postgresql":
+                statement = postgresql_insert(AlertRun).values(values).on_conflict_do_nothing()
+            else:
+                statement = sqlite_insert(AlertRun).values(values).on_conflict_do_nothing()
+
+            await session.execute(statement)
+            await session.commit()
+            run = await session.get(AlertRun, (day, slot_key))
+
+        return run
 
-        alert.count += 1
+
+def get_chat_slot_key(slot: ChatSlot) -> str:
+    time_zone = "all" if slot.time_zone is None else f"{slot.time_zone:+d}"
+    return f"{time_zone}:{slot.index}/{slot.count}"
+
+
+def get_alert_run_slot(run: AlertRun) -> ChatSlot:
+    return ChatSlot(run.time_zone, run.slot_index, run.slot_count)
+
+
+async def finish_alert_run(async_session: async_sessionmaker[AsyncSession], run: AlertRun) -> bool:
+    """
+    Mark the run as finished unless some alerts of its slot are claimed but not swept yet,
+    they are processed by another process or were claimed by a crashed one and the run has to be resumed.
+    """
+    async with async_session() as session:
+        unswept_alert_id = await session.scalar(
+            select(Alert.id)
+            .join(Chat, Chat.id == Alert.chat_id)
+            .where(
+                get_chat_slot_condition(get_alert_run_slot(run)),
+                Alert.claimed_at >= run.started_at,
+                or_(Alert.swept_at.is_(None), Alert.swept_at < Alert.claimed_at),
+            )
+            .limit(1)
+        )
+
+        if unswept_alert_id is not None:
+            return False
+
+        await session.execute(
+            update(AlertRun)
+            .where(AlertRun.day == run.day, AlertRun.slot_key == run.slot_key)
+            .values(finished_at=datetime.now(UTC))
+        )
         await session.commit()
 
+    return True
 
-async def update_tire_type(async_session: async_sessionmaker[AsyncSession], chat_id: int) -> None:
+
+async def get_unfinished_alert_runs(
+    async_session: async_sessionmaker[AsyncSession], started_before: datetime
+) -> list[AlertRun]:
+    # alerts of older runs are swept by the next runs of their slots
+    started_after = datetime.now(UTC) - SWEEP_INTERVAL
+
+    async with async_session() as session:
+        runs = await session.scalars(
+            select(AlertRun)
+            .where(
+                AlertRun.finished_at.is_(None),
+                AlertRun.started_at < started_before,
+                AlertRun.started_at > started_after,
+            )
+            .order_by(AlertRun.started_at)
+        )
+        return list(runs)
+
+
+async def delete_alert_runs(async_session: async_sessionmaker[AsyncSession], before: date) -> None:
+    async with async_session() as session:
+        await session.execute(delete(AlertRun).where(AlertRun.day < before))
+        await session.execute(delete(AlertDelivery).where(AlertDelivery.day < before))
+        await session.commit()
+
+
+async def reserve_alert_deliveries(
+    async_session: async_sessionmaker[AsyncSession], day: date, alerts: list[AlertRecord]
+) -> set[int]:
+    """
+    Reserve the deliveries of the alerts on the day before they are sent, return ids of the chats already sent to.
+    Those were sent by an earlier attempt of the run and must not be sent again, deliveries reserved
+    by an interrupted attempt but not confirmed as sent are sent again.
+    """
+    if not alerts:
+        return set()
+
+    values = [{"chat_id": alert.chat_id, "day": day, "type": alert.type} for alert in alerts]
+
+    async with async_session() as session:
+        if session.get_bind().dialect.name == "postgresql":
+            statement = postgresql_insert(AlertDelivery).values(values).on_conflict_do_nothing()
+        else:
+            statement = sqlite_insert(AlertDelivery).values(values).on_conflict_do_nothing()
+
+        await session.execute(statement)
+        sent_chat_ids = set(
+            await session.scalars(
+                select(AlertDelivery.chat_id).where(
+                    tuple_(AlertDelivery.chat_id, AlertDelivery.day, AlertDelivery.type).in_(
+                        [(alert.chat_id, day, alert.type) for alert in alerts]
+                    ),
+                    AlertDelivery.sent_at.is_not(None),
+                )
+            )
+        )
+        await session.commit()
+
+    return sent_chat_ids
+
+
+async def confirm_alert_delivery(
+    async_session: async_sessionmaker[AsyncSession], day: date, alert: AlertRecord
+) -> None:
     async with async_session() as session:
-        chat = await session.get(Chat, chat_id)
+        await session.execute(
+            update(AlertDelivery)
+            .where(
+                AlertDelivery.chat_id == alert.chat_id,
+                AlertDelivery.day == day,
+                AlertDelivery.type == alert.type,
+            )
+            .values(sent_at=datetime.now(UTC))
+        )
+        await session.commit()
 
-        if chat is None:
+
+@asynccontextmanager
+async def try_advisory_lock(async_session: async_sessionmaker[AsyncSession], key: int) -> AsyncIterator[bool]:
+    """
+    Hold a lock shared by all processes using the database, yield False when another process holds it.
+    The lock is held by a dedicated connection outside of a transaction, so it can guard long-running jobs.
+    Backends without advisory locks serve a single process, so the lock is always acquired there.
+    """
+    async with async_session() as session:
+        if session.get_bind().dialect.name != "postgresql":
+            yield True
             return
 
-        chat.tire_type = get_opposite_tire_type(chat.tire_type)
-        chat.alert.type = chat.tire_type
-        chat.alert.count = 0
+        async with session.bind.connect() as connection:
+            acquired = await connection.scalar(select(func.pg_try_advisory_lock(key)))
+            await connection.commit()
+
+            try:
+                yield acquired
+            finally:
+                if acquired:
+                    await connection.scalar(select(func.pg_advisory_unlock(key)))
+                    await connection.commit()
+
+
+async def increment_alert_counter(async_session: async_sessionmaker[AsyncSession], alert_id: int) -> None:
+    await update_sent_alerts(async_session, [alert_id], [])
+
+
+async def update_tire_type(async_session: async_sessionmaker[AsyncSession], chat_id: int) -> None:
+    await update_sent_alerts(async_session, [], [chat_id])
+
+
+async def update_sent_alerts(
+    async_session: async_sessionmaker[AsyncSession],
+    incremented_alert_ids: list[int],
+    expired_chat_ids: list[int],
+    swept_alert_ids: Sequence[int] = (),
+    released_deliveries: Sequence[tuple[int, date, int]] = (),
+) -> None:
+    """
+    Increment counters of the sent alerts and switch the tire type of the chats with expired alerts,
+    in set-based statements within a single transaction.
+    The same transaction marks the processed alerts as swept and releases deliveries of the failed ones,
+    so the progress of an alerts check is saved together with its effects.
+    """
+    changed_chat_ids = list(expired_chat_ids)
+
+    async with async_session() as session:
+        if swept_alert_ids:
+            await session.execute(
+                update(Alert)
+                .where(Alert.id.in_(swept_alert_ids))
+                .values(swept_at=datetime.now(UTC))
+                .execution_options(synchronize_session=False)
+            )
+
+        if released_deliveries:
+            await session.execute(
+                delete(AlertDelivery).where(
+                    tuple_(AlertDelivery.chat_id, AlertDelivery.day, AlertDelivery.type).in_(released_deliveries)
+                )
+            )
+
+        if incremented_alert_ids:
+            incremented_chat_ids = await session.scalars(
+                update(Alert)
+                .where(Alert.id.in_(incremented_alert_ids))
+                .values(count=Alert.count + 1)
+                .returning(Alert.chat_id)
+                .execution_options(synchronize_session=False)
+            )
+            changed_chat_ids.extend(incremented_chat_ids)
+
+        if expired_chat_ids:
+            await session.execute(
+                update(Chat)
+                .where(Chat.id.in_(expired_chat_ids))
+                .values(tire_type=case((Chat.tire_type == TireType.Winter, TireType.Summer), else_=TireType.Winter))
+                .execution_options(synchronize_session=False)
+            )
+            await session.execute(
+                update(Alert)
+                .where(Alert.chat_id.in_(expired_chat_ids))
+                .values(
+                    type=select(Chat.tire_type).where(Chat.id == Alert.chat_id).scalar_subquery(),
+                    count=0,
+                    # the reset alert is checked again by the current sweep
+                    claimed_at=None,
+                    swept_at=None,
+                )
+                .execution_options(synchronize_session=False)
+            )
+
+        await session.commit()
+
+    get_chat_cache(async_session).invalidate(changed_chat_ids)
+
+
+async def get_forecasts(
+    async_session: async_sessionmaker[AsyncSession], cells: list[tuple[float, float]], fetched_after: datetime
+) -> list[Forecast]:
+    async with async_session() as session:
+        forecasts = await session.execute(
+            select(Forecast)
+            .where(tuple_(Forecast.lat, Forecast.lon).in_(cells), Forecast.fetched_at >= fetched_after)
+            .order_by(Forecast.day)
+        )
+        return list(forecasts.scalars())
+
+
+async def replace_forecasts(async_session: async_sessionmaker[AsyncSession], forecasts: list[Forecast]) -> None:
+    cells = list({(forecast.lat, forecast.lon) for forecast in forecasts})
+
+    async with async_session() as session:
+        await session.execute(delete(Forecast).where(tuple_(Forecast.lat, Forecast.lon).in_(cells)))
+        session.add_all(forecasts)
+        await session.commit()
+
+
+async def get_place_name(async_session: async_sessionmaker[AsyncSession], lat: float, lon: float) -> str | None:
+    async with async_session() as session:
+        place_name = await session.get(PlaceName, (lat, lon))
+        return None if place_name is None else place_name.name
+
+
+async def save_place_name(async_session: async_sessionmaker[AsyncSession], lat: float, lon: float, name: str) -> None:
+    async with async_session() as session:
+        await session.merge(PlaceName(lat=lat, lon=lon, name=name))
+        await session.commit()
+
+
+async def get_fsm_state(
+    async_session: async_sessionmaker[AsyncSession], key: str, updated_after: datetime
+) -> FSMState | None:
+    async with async_session() as session:
+        return await session.scalar(select(FSMState).where(FSMState.key == key, FSMState.updated_at > updated_after))
+
+
+async def save_fsm_states(
+    async_session: async_sessionmaker[AsyncSession],
+    states: dict[str, dict[str, Any]],
+    updated_at: datetime,
+    updated_after: datetime,
+) -> None:
+    """
+    Save the changed columns of every state, a cleared state is deleted.
+    The columns which are not changed are kept unless the saved state has expired.
+    """
+    deleted_keys = [key for key, values in states.items() if values == {"state": None, "data": {}}]
+    changed_states: defaultdict[tuple[str, ...], list[dict[str, Any]]] = defaultdict(list)
+
+    for key, values in states.items():
+        if key not in deleted_keys:
+            changed_states[tuple(sorted(values))].append({"key": key, "updated_at": updated_at, **values})
+
+    async with async_session() as session:
+        if deleted_keys:
+            await session.execute(delete(FSMState).where(FSMState.key.in_(deleted_keys)))
+
+        for columns, values in changed_states.items():
+            if session.get_bind().dialect.name == "postgresql":
+                statement = postgresql_insert(FSMState).values(values)
+            else:
+                statement = sqlite_insert(FSMState).values(values)
+
+            await session.execute(
+                statement.on_conflict_do_update(
+                    index_elements=[FSMState.key],
+                    set_={
+                        "updated_at": statement.excluded.updated_at,
+                        **{
+                            column: (
+                                statement.excluded[column]
+                                if column in columns
+                                else case((FSMState.updated_at > updated_after, getattr(FSMState, column)), else_=None)
+                            )
+                            for column in ("state", "data")
+                        },
+                    },
+                )
+            )
+
+        await session.commit()
+
+
+async def delete_expired_fsm_states(async_session: async_sessionmaker[AsyncSession], updated_before: datetime) -> None:
+    async with async_session() as session:
+        await session.execute(delete(FSMState).where(FSMState.updated_at <= updated_before))
         await session.commit()
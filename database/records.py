@@ -0,0 +1,28 @@
+from typing import NamedTuple
+
+
+class AlertRecord(NamedTuple):
+    """
+    Read-only projection of an alert and its chat, with only the columns the alerts check needs.
+    Unlike ORM objects it is not tracked by the session and takes the memory of a tuple.
+    """
+
+    id: int
+    type: int
+    count: int
+    chat_id: int
+    lat: float
+    lon: float
+    tire_type: int
+
+
+class ChatSlot(NamedTuple):
+    """
+    Part of the chats processed by a single run of the alerts check:
+    the chats of the `time_zone` (UTC offset in hours derived from the longitude, all chats when None)
+    whose id modulo `count` equals `index`.
+    """
+
+    time_zone: int | None
+    index: int
+    count: int
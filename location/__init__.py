@@ -1,3 +1,7 @@
 from .location_api import *  # noqa
 from .nominatim_api import *  # noqa
 from .parse import parse_coordinates  # noqa
+from .grid import LocationKey, get_location_key, get_location_cell, get_cell_index, get_cell_center  # noqa
+from .place_name_storage import PlaceNameStorage  # noqa
+from .cached_location_api import CachedLocationAPI  # noqa
+from .gazetteer_api import GazetteerLocationAPI  # noqa
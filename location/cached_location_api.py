@@ -0,0 +1,72 @@
+import logging
+
+from common import LRUCache
+
+from .grid import LocationKey, get_location_cell, get_location_key
+from .location_api import Location, LocationAPI
+from .place_name_storage import PlaceNameStorage
+
+logger = logging.getLogger(__name__)
+
+
+class CachedLocationAPI(LocationAPI):
+    """
+    Caches place names in the in-process LRU and the optional persistent storage,
+    keyed by coordinates rounded to the grid cell, so repeated lookups of
+    the same chat location do not reach the provider.
+    """
+
+    def __init__(
+        self,
+        location_api: LocationAPI,
+        storage: PlaceNameStorage | None,
+        cell_size: float,
+        lru_size: int,
+    ) -> None:
+        self.location_api = location_api
+        self.storage = storage
+        self.cell_size = cell_size
+        self.lru: LRUCache[LocationKey, str] = LRUCache(lru_size)
+
+    async def search(self, search_term: str) -> Location | None:
+        return await self.location_api.search(search_term)
+
+    async def get_place_name(self, location: Location) -> str | None:
+        key = get_location_key(get_location_cell(location, self.cell_size))
+
+        place_name = self.lru.get(key)
+        if place_name is not None:
+            return place_name
+
+        place_name = await self.load_place_name(key)
+        if place_name is not None:
+            self.lru.set(key, place_name)
+            return place_name
+
+        place_name = await self.location_api.get_place_name(location)
+        if place_name is None:
+            return None
+
+        self.lru.set(key, place_name)
+        await self.save_place_name(key, place_name)
+
+        return place_name
+
+    async def load_place_name(self, key: LocationKey) -> str | None:
+        if self.storage is None:
+            return None
+
+        try:
+            return await self.storage.get_place_name(key)
+        except Exception as e:
+            logger.exception(e)
+            return None
+
+    async def save_place_name(self, key: LocationKey, place_name: str) -> None:
+        if self.storage is None:
+            return
+
+        try:
+            await self.storage.save_place_name(key, place_name)
+        except Exception as e:
+            logger.exception(e)
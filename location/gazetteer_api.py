@@ -0,0 +1,89 @@
+import logging
+import math
+import mmap
+from array import array
+
+from .kd_tree import KDTree
+from .location_api import Location, LocationAPI
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS_KM = 6371
+
+# Columns of the GeoNames gazetteer, https://download.geonames.org/export/dump/readme.txt
+NAME_COLUMN = 1
+LAT_COLUMN = 4
+LON_COLUMN = 5
+COUNTRY_CODE_COLUMN = 8
+
+
+def to_unit_vector(lat: float, lon: float) -> tuple[float, float, float]:
+    # points on the unit sphere, so the nearest neighbour does not depend on longitude wrapping
+    lat, lon = math.radians(lat), math.radians(lon)
+    return math.cos(lat) * math.cos(lon), math.cos(lat) * math.sin(lon), math.sin(lat)
+
+
+def chord_to_km(chord: float) -> float:
+    return 2 * math.asin(min(chord / 2, 1)) * EARTH_RADIUS_KM
+
+
+class GazetteerLocationAPI(LocationAPI):
+    """
+    Offline reverse geocoder over a local GeoNames gazetteer file (e.g. cities1000.txt).
+    The file is memory-mapped and only coordinates and line offsets are kept in memory,
+    so processes serving the same file share its pages through the OS page cache.
+    Search and points farther than `max_distance_km` from any place are delegated to the fallback API.
+    """
+
+    def __init__(self, path: str, fallback_api: LocationAPI, max_distance_km: float) -> None:
+        self.fallback_api = fallback_api
+        self.max_distance_km = max_distance_km
+
+        with open(path, "rb") as file:
+            self.data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        xs, ys, zs = array("d"), array("d"), array("d")
+        self.offsets = array("q")
+
+        while line := self.data.readline():
+            offset = self.data.tell() - len(line)
+            columns = line.split(b"\t")
+
+            try:
+                x, y, z = to_unit_vector(float(columns[LAT_COLUMN]), float(columns[LON_COLUMN]))
+            except (IndexError, ValueError):
+                continue
+
+            xs.append(x)
+            ys.append(y)
+            zs.append(z)
+            self.offsets.append(offset)
+
+        self.tree = KDTree(xs, ys, zs)
+        logger.info("Loaded %s places from the gazetteer %s", len(self.offsets), path)
+
+    async def search(self, search_term: str) -> Location | None:
+        return await self.fallback_api.search(search_term)
+
+    async def get_place_name(self, location: Location) -> str | None:
+        if not self.offsets:
+            return await self.fallback_api.get_place_name(location)
+
+        index, chord = self.tree.nearest(to_unit_vector(float(location["lat"]), float(location["lon"])))
+
+        if chord_to_km(chord) > self.max_distance_km:
+            return await self.fallback_api.get_place_name(location)
+
+        return self.read_place_name(self.offsets[index])
+
+    def read_place_name(self, offset: int) -> str:
+        end = self.data.find(b"\n", offset)
+        if end == -1:
+            end = len(self.data)
+
+        columns = self.data[offset:end].decode().split("\t")
+
+        return f"{columns[NAME_COLUMN]}, {columns[COUNTRY_CODE_COLUMN]}"
+
+    def close(self) -> None:
+        self.data.close()
@@ -0,0 +1,27 @@
+import math
+
+from .location_api import Location
+
+type LocationKey = tuple[float, float]
+
+
+def get_location_key(location: Location) -> LocationKey:
+    return float(location["lat"]), float(location["lon"])
+
+
+def get_location_cell(location: Location, cell_size: float) -> Location:
+    """
+    Snap the location to the center of the grid cell it belongs to,
+    so that close locations share the same forecast.
+    """
+    lat, lon = get_location_key(location)
+    return get_cell_center(get_cell_index(lat, cell_size), get_cell_index(lon, cell_size), cell_size)
+
+
+def get_cell_index(coordinate: float, cell_size: float) -> int:
+    # rounds half up, the same as the index computed by the database, see `database.queries.get_cell_index`
+    return math.floor(coordinate / cell_size + 0.5)
+
+
+def get_cell_center(x: int, y: int, cell_size: float) -> Location:
+    return {"lat": round(x * cell_size, 6), "lon": round(y * cell_size, 6)}
@@ -0,0 +1,65 @@
+import math
+from array import array
+
+
+class KDTree:
+    """
+    Static 3-d tree for nearest neighbour lookups.
+    The tree is implicit: `order` holds point indexes arranged so that every
+    range has its median point in the middle and the halves on both sides.
+    """
+
+    dimensions = 3
+
+    def __init__(self, xs: array, ys: array, zs: array) -> None:
+        self.axes = (xs, ys, zs)
+        self.order = array("q", range(len(xs)))
+        self.build(0, len(xs), 0)
+
+    def build(self, start: int, end: int, depth: int) -> None:
+        if end - start <= 1:
+            return
+
+        coordinates = self.axes[depth % self.dimensions]
+        self.order[start:end] = array("q", sorted(self.order[start:end], key=coordinates.__getitem__))
+
+        middle = (start + end) // 2
+        self.build(start, middle, depth + 1)
+        self.build(middle + 1, end, depth + 1)
+
+    def nearest(self, point: tuple[float, float, float]) -> tuple[int, float]:
+        """
+        Return the index of the nearest point and the euclidean distance to it.
+        """
+        best_index, best_distance = -1, math.inf
+
+        def search(start: int, end: int, depth: int) -> None:
+            nonlocal best_index, best_distance
+
+            if start >= end:
+                return
+
+            middle = (start + end) // 2
+            index = self.order[middle]
+
+            distance = sum((point[axis] - self.axes[axis][index]) ** 2 for axis in range(self.dimensions))
+            if distance < best_distance:
+                best_index, best_distance = index, distance
+
+            axis = depth % self.dimensions
+            difference = point[axis] - self.axes[axis][index]
+
+            if difference < 0:
+                near, far = (start, middle), (middle + 1, end)
+            else:
+                near, far = (middle + 1, end), (start, middle)
+
+            search(*near, depth + 1)
+
+            # the other half can only hold a closer point when the splitting plane is closer than the best one
+            if difference**2 < best_distance:
+                search(*far, depth + 1)
+
+        search(0, len(self.order), 0)
+
+        return best_index, math.sqrt(best_distance)
@@ -1,10 +1,21 @@
-import httpx
+import logging
+
+from httpx import AsyncClient
+
+from common import SingleFlight, TokenBucket
 
 from .location_api import Location, LocationAPI
 
+logger = logging.getLogger(__name__)
+
 BASE_URL = "https://nominatim.openstreetmap.org/search"
 USER_AGENT = "TieTimeBot/1.0"
 
+# https://operations.osmfoundation.org/policies/nominatim/ allows an absolute maximum of 1 request per second
+RATE_LIMIT = 1
+# Seconds a request waits for the rate limiter before it is given up
+MAX_WAIT = 10
+
 
 def build_headers() -> dict:
     return {"User-Agent": USER_AGENT}
@@ -13,18 +24,18 @@ def build_headers() -> dict:
 class NominatimAPI(LocationAPI):
     # https://nominatim.org/release-docs/latest/
 
+    def __init__(self, client: AsyncClient, rate_limit: float = RATE_LIMIT, max_wait: float = MAX_WAIT) -> None:
+        self.client = client
+        self.rate_limiter = TokenBucket(rate_limit)
+        self.max_wait = max_wait
+        self.single_flight: SingleFlight[list | None] = SingleFlight()
+
     async def search(self, search_term: str) -> Location:
         params = {"q": search_term, "format": "json", "limit": 1}
 
-        async with httpx.AsyncClient() as client:
-            response = await client.get(BASE_URL, params=params, headers=build_headers())
+        data = await self.request(params)
 
-        if response.status_code != 200:
-            return None
-
-        data = response.json()
-
-        if len(data) == 0:
+        if not data:
             return None
 
         location = data[0]
@@ -40,16 +51,26 @@ class NominatimAPI(LocationAPI):
             "limit": 1,
         }
 
-        async with httpx.AsyncClient() as client:
-            response = await client.get(BASE_URL, params=params, headers=build_headers())
+        data = await self.request(params)
 
-        if response.status_code != 200:
+        if not data:
             return None
 
-        data = response.json()
+        place = data[0]
+        return place["display_name"]
+
+    async def request(self, params: dict) -> list | None:
+        # identical concurrent queries share a single request
+        return await self.single_flight.run(tuple(sorted(params.items())), lambda: self.send_request(params))
 
-        if len(data) == 0:
+    async def send_request(self, params: dict) -> list | None:
+        if not await self.rate_limiter.acquire(self.max_wait):
+            logger.warning("Nominatim request is dropped, the rate limit queue is full")
             return None
 
-        place = data[0]
-        return place["display_name"]
+        response = await self.client.get(BASE_URL, params=params, headers=build_headers())
+
+        if response.status_code != 200:
+            return None
+
+        return response.json()
@@ -0,0 +1,13 @@
+from abc import ABC, abstractmethod
+
+from .grid import LocationKey
+
+
+class PlaceNameStorage(ABC):
+    @abstractmethod
+    async def get_place_name(self, key: LocationKey) -> str | None:
+        pass
+
+    @abstractmethod
+    async def save_place_name(self, key: LocationKey, place_name: str) -> None:
+        pass
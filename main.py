@@ -1,6 +1,8 @@
 import asyncio
 import logging
+import multiprocessing
 import os
+import signal
 import sys
 
 from aiogram import Bot, Dispatcher
@@ -8,12 +10,29 @@ from aiogram.enums import ParseMode
 from aiogram.client.default import DefaultBotProperties
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.interval import IntervalTrigger
 from dotenv import load_dotenv
 
-from chat import settings_router, alert_router, ChatMessages, check_for_alerts_factory
-from location import NominatimAPI
-from weather_forecast import WeatherAPI
-from database import DBEngine
+from common import HTTPClientSettings, LRUCache, create_http_client
+from chat import (
+    settings_router,
+    alert_router,
+    ChatMessages,
+    AlertsSettings,
+    TelegramSendQueue,
+    TelegramSendSettings,
+    WebhookSettings,
+    run_webhook,
+    check_for_alerts_factory,
+    resume_alert_runs_factory,
+    get_alert_schedule,
+    get_prefetch_schedule,
+    prefetch_forecasts_factory,
+    WEATHER_FORECAST_DAYS,
+)
+from location import NominatimAPI, CachedLocationAPI, GazetteerLocationAPI
+from weather_forecast import WeatherAPI, CachedWeatherForecastAPI
+from database import DBEngine, DBEngineSettings, DBForecastStorage, DBPlaceNameStorage, DBFSMStorage, FSMStorageSettings
 
 load_dotenv(override=True)
 
@@ -21,25 +40,203 @@ BOT_TOKEN = os.getenv("BOT_TOKEN")
 WEATHER_API_KEY = os.getenv("WEATHER_API_KEY")
 DATABASE_URL = os.getenv("DATABASE_URL")
 
+# Database connection pool and logging, see DBEngineSettings
+DB_ENGINE_SETTINGS: DBEngineSettings = {
+    "pool_size": int(os.getenv("DATABASE_POOL_SIZE") or 10),
+    "max_overflow": int(os.getenv("DATABASE_MAX_OVERFLOW") or 20),
+    "pool_recycle": float(os.getenv("DATABASE_POOL_RECYCLE") or 30 * 60),
+    "pool_pre_ping": (os.getenv("DATABASE_POOL_PRE_PING") or "true").lower() == "true",
+    "statement_cache_size": int(os.getenv("DATABASE_STATEMENT_CACHE_SIZE") or 500),
+    "log_level": (os.getenv("DATABASE_LOG_LEVEL") or "WARNING").upper(),
+    "chat_cache_size": int(os.getenv("CHAT_CACHE_SIZE") or 4096),
+    "chat_cache_ttl": float(os.getenv("CHAT_CACHE_TTL") or 300),
+}
 
-def start_alerts_scheduler(check_for_alerts):
+# Conversation state of the settings flow, see FSMStorageSettings
+FSM_STORAGE_SETTINGS: FSMStorageSettings = {
+    "ttl": float(os.getenv("FSM_STATE_TTL") or 24 * 60 * 60),
+    "write_delay": float(os.getenv("FSM_WRITE_DELAY") or 0.05),
+}
+
+# Size of the grid cell (in degrees) used to share forecasts between close chats
+FORECAST_CELL_SIZE = float(os.getenv("FORECAST_CELL_SIZE") or 0.1)
+# Seconds a fetched forecast is served from the cache
+FORECAST_CACHE_TTL = float(os.getenv("FORECAST_CACHE_TTL") or 12 * 60 * 60)
+# Number of grid cells kept in the in-process forecast cache
+FORECAST_CACHE_SIZE = int(os.getenv("FORECAST_CACHE_SIZE") or 1024)
+
+# Daily alerts check sweep, see AlertsSettings
+ALERTS_SETTINGS: AlertsSettings = {
+    "forecast_cell_size": FORECAST_CELL_SIZE,
+    "workers": int(os.getenv("ALERTS_WORKERS") or 32),
+    "task_timeout": float(os.getenv("ALERTS_TASK_TIMEOUT") or 60),
+    "page_size": int(os.getenv("ALERTS_PAGE_SIZE") or 1000),
+    "forecast_batch_size": int(os.getenv("ALERTS_FORECAST_BATCH_SIZE") or 500),
+    "update_batch_size": int(os.getenv("ALERTS_UPDATE_BATCH_SIZE") or 500),
+    "prefetch_window": float(os.getenv("FORECAST_PREFETCH_WINDOW") or 2 * 60 * 60),
+    "claim_timeout": float(os.getenv("ALERTS_CLAIM_TIMEOUT") or 15 * 60),
+    "temperature_delta": float(os.getenv("ALERTS_TEMPERATURE_DELTA") or 1),
+    "tire_decision_rules": {
+        "hysteresis": float(os.getenv("TIRE_HYSTERESIS") or 0),
+        "min_consecutive_days": int(os.getenv("TIRE_MIN_CONSECUTIVE_DAYS") or 1),
+    },
+}
+
+# Hour of the daily alerts check, in the local time of every chat (derived from its longitude) or in server time
+ALERTS_HOUR = int(os.getenv("ALERTS_HOUR") or 9)
+ALERTS_LOCAL_TIME = (os.getenv("ALERTS_LOCAL_TIME") or "true").lower() == "true"
+# Chats of the alerts check are split into slots by id, the runs of the slots are spread over the window
+ALERTS_WINDOW = float(os.getenv("ALERTS_WINDOW") or 60 * 60)
+ALERTS_SLOTS = int(os.getenv("ALERTS_SLOTS") or 6)
+
+# Outbound Telegram requests, see TelegramSendSettings
+TELEGRAM_SEND_SETTINGS: TelegramSendSettings = {
+    "workers": int(os.getenv("TELEGRAM_MAX_CONCURRENCY") or 20),
+    "rate_limit": float(os.getenv("TELEGRAM_RATE_LIMIT") or 30),
+    "chat_rate_limit": float(os.getenv("TELEGRAM_CHAT_RATE_LIMIT") or 1),
+    "group_rate_limit": float(os.getenv("TELEGRAM_GROUP_RATE_LIMIT") or 20 / 60),
+    "max_retries": int(os.getenv("TELEGRAM_MAX_RETRIES") or 3),
+}
+
+# Requests per second sent to Nominatim and seconds a request may wait for its turn
+NOMINATIM_RATE_LIMIT = float(os.getenv("NOMINATIM_RATE_LIMIT") or 1)
+NOMINATIM_MAX_WAIT = float(os.getenv("NOMINATIM_MAX_WAIT") or 10)
+
+# Size of the grid cell (in degrees) used to share place names between close locations
+PLACE_NAME_CELL_SIZE = float(os.getenv("PLACE_NAME_CELL_SIZE") or 0.001)
+# Number of place names kept in the in-process cache
+PLACE_NAME_CACHE_SIZE = int(os.getenv("PLACE_NAME_CACHE_SIZE") or 4096)
+# Keep place names in the database, so they survive restarts and are shared between processes
+PLACE_NAME_PERSISTENT = (os.getenv("PLACE_NAME_PERSISTENT") or "true").lower() == "true"
+
+# Seconds between logs of the hit rates of the in-process caches
+CACHE_STATS_INTERVAL = float(os.getenv("CACHE_STATS_INTERVAL") or 60 * 60)
+
+# GeoNames gazetteer file (e.g. cities1000.txt) to resolve place names offline, Nominatim is used when not set
+GAZETTEER_PATH = os.getenv("GAZETTEER_PATH")
+# Farther from any gazetteer place the place name is resolved with Nominatim
+GAZETTEER_MAX_DISTANCE_KM = float(os.getenv("GAZETTEER_MAX_DISTANCE_KM") or 50)
+
+# Hours before ALERTS_HOUR when the forecast prefetch of a time zone starts, it should end before the alerts check
+FORECAST_PREFETCH_HOURS_BEFORE = int(os.getenv("FORECAST_PREFETCH_HOURS_BEFORE") or 3)
+
+# Maximum number of concurrent requests to the weather forecast provider
+WEATHER_API_MAX_CONCURRENCY = int(os.getenv("WEATHER_API_MAX_CONCURRENCY") or 8)
+# Number of locations in a single bulk forecast request, 0 disables bulk requests
+WEATHER_API_BULK_SIZE = int(os.getenv("WEATHER_API_BULK_SIZE") or 50)
+WEATHER_API_URL = os.getenv("WEATHER_API_URL")
+
+# Connection pool of the HTTP clients shared by the weather and location providers
+HTTP_CLIENT_SETTINGS: HTTPClientSettings = {
+    "max_connections": int(os.getenv("HTTP_MAX_CONNECTIONS") or 100),
+    "max_keepalive_connections": int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS") or 20),
+    "keepalive_expiry": float(os.getenv("HTTP_KEEPALIVE_EXPIRY") or 30),
+    "timeout": float(os.getenv("HTTP_TIMEOUT") or 10),
+}
+
+# Updates are served by an HTTP server when the webhook url is set, see WebhookSettings
+WEBHOOK_SETTINGS: WebhookSettings = {
+    "url": os.getenv("WEBHOOK_URL") or "",
+    "host": os.getenv("WEBHOOK_HOST") or "0.0.0.0",
+    "port": int(os.getenv("WEBHOOK_PORT") or 8080),
+    "secret_token": os.getenv("WEBHOOK_SECRET_TOKEN") or "",
+    "workers": int(os.getenv("WEBHOOK_WORKERS") or 1),
+    "max_connections": int(os.getenv("WEBHOOK_MAX_CONNECTIONS") or 40),
+    "queue_size": int(os.getenv("WEBHOOK_QUEUE_SIZE") or 1000),
+    "handlers": int(os.getenv("WEBHOOK_HANDLERS") or 64),
+}
+
+
+def get_worker_rate_limit(rate_limit: float) -> float:
+    # every webhook worker has its own rate limiters, so the limits of the whole bot are split between them
+    return rate_limit / (WEBHOOK_SETTINGS["workers"] if WEBHOOK_SETTINGS["url"] else 1)
+
+
+def start_cache_stats_scheduler(caches: dict[str, LRUCache]) -> None:
+    def log_cache_hit_rates() -> None:
+        for name, cache in caches.items():
+            logging.info(
+                "Hit rate of the %s cache: %.1f%% of %s lookups", name, cache.hit_rate * 100, cache.hits + cache.misses
+            )
+
+    scheduler = AsyncIOScheduler()
+    scheduler.add_job(log_cache_hit_rates, IntervalTrigger(seconds=CACHE_STATS_INTERVAL))
+    scheduler.start()
+
+
+def start_alerts_scheduler(check_for_alerts, resume_alert_runs, prefetch_forecasts):
     scheduler = AsyncIOScheduler()
-    # Schedule the job to run daily at 9:00 AM
-    scheduler.add_job(check_for_alerts, CronTrigger(hour=9, minute=0))
+    # Warm the forecast cache of every time zone ahead of its alerts check
+    for start, slot in get_prefetch_schedule(ALERTS_HOUR - FORECAST_PREFETCH_HOURS_BEFORE, ALERTS_LOCAL_TIME):
+        scheduler.add_job(
+            prefetch_forecasts,
+            CronTrigger(hour=start.hour, minute=0, timezone="UTC" if ALERTS_LOCAL_TIME else None),
+            args=[slot],
+        )
+    # Schedule the job to run daily for every slot of chats, at 9:00 AM local time by default
+    for start, slot in get_alert_schedule(ALERTS_HOUR, ALERTS_LOCAL_TIME, ALERTS_WINDOW, ALERTS_SLOTS):
+        scheduler.add_job(
+            check_for_alerts,
+            CronTrigger(
+                hour=start.hour,
+                minute=start.minute,
+                second=start.second,
+                timezone="UTC" if ALERTS_LOCAL_TIME else None,
+            ),
+            args=[slot],
+            misfire_grace_time=None,
+        )
+    # Resume alerts checks interrupted by a crash, once their claimed alerts can be claimed again
+    scheduler.add_job(resume_alert_runs, IntervalTrigger(seconds=ALERTS_SETTINGS["claim_timeout"]))
     scheduler.start()
 
 
-async def main() -> None:
+async def main(worker: int = 0) -> None:
     bot = Bot(token=BOT_TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
+    send_queue = TelegramSendQueue(
+        {**TELEGRAM_SEND_SETTINGS, "rate_limit": get_worker_rate_limit(TELEGRAM_SEND_SETTINGS["rate_limit"])}
+    )
+    bot.session.middleware(send_queue)
 
     messages = ChatMessages()
-    location_api = NominatimAPI()
-    weather_forecast_api = WeatherAPI(WEATHER_API_KEY)
 
-    db_engine = DBEngine(DATABASE_URL)
-    await db_engine.create_all()
+    db_engine = DBEngine(DATABASE_URL, DB_ENGINE_SETTINGS)
+
+    location_http_client = create_http_client(HTTP_CLIENT_SETTINGS)
+    cached_location_api = location_api = CachedLocationAPI(
+        NominatimAPI(
+            location_http_client,
+            rate_limit=get_worker_rate_limit(NOMINATIM_RATE_LIMIT),
+            max_wait=NOMINATIM_MAX_WAIT,
+        ),
+        DBPlaceNameStorage(db_engine.get_db_session) if PLACE_NAME_PERSISTENT else None,
+        cell_size=PLACE_NAME_CELL_SIZE,
+        lru_size=PLACE_NAME_CACHE_SIZE,
+    )
+
+    if GAZETTEER_PATH:
+        location_api = GazetteerLocationAPI(GAZETTEER_PATH, location_api, GAZETTEER_MAX_DISTANCE_KM)
+
+    weather_http_client = create_http_client(HTTP_CLIENT_SETTINGS)
+    weather_forecast_api = CachedWeatherForecastAPI(
+        WeatherAPI(
+            WEATHER_API_KEY,
+            weather_http_client,
+            max_concurrency=WEATHER_API_MAX_CONCURRENCY,
+            bulk_size=WEATHER_API_BULK_SIZE,
+            base_url=WEATHER_API_URL,
+        ),
+        DBForecastStorage(db_engine.get_db_session),
+        cell_size=FORECAST_CELL_SIZE,
+        days=WEATHER_FORECAST_DAYS,
+        ttl=FORECAST_CACHE_TTL,
+        lru_size=FORECAST_CACHE_SIZE,
+    )
+
+    fsm_storage = DBFSMStorage(db_engine.get_db_session, FSM_STORAGE_SETTINGS)
 
     dp = Dispatcher(
+        storage=fsm_storage,
         location_api=location_api,
         weather_forecast_api=weather_forecast_api,
         db_session=db_engine.get_db_session,
@@ -48,19 +245,91 @@ async def main() -> None:
     dp.include_router(settings_router)
     dp.include_router(alert_router)
 
-    start_alerts_scheduler(
-        check_for_alerts_factory(
-            bot,
-            messages,
-            weather_forecast_api,
-            db_session=db_engine.get_db_session,
+    # Other webhook workers only handle updates, the alerts are checked by the first one
+    if worker == 0:
+        start_alerts_scheduler(
+            check_for_alerts_factory(
+                bot,
+                messages,
+                weather_forecast_api,
+                db_session=db_engine.get_db_session,
+                settings=ALERTS_SETTINGS,
+            ),
+            resume_alert_runs_factory(
+                bot,
+                messages,
+                weather_forecast_api,
+                db_session=db_engine.get_db_session,
+                settings=ALERTS_SETTINGS,
+            ),
+            prefetch_forecasts_factory(
+                weather_forecast_api,
+                db_session=db_engine.get_db_session,
+                settings=ALERTS_SETTINGS,
+            ),
         )
+
+    start_cache_stats_scheduler(
+        {
+            "chat": db_engine.chat_cache.cache,
+            "forecast": weather_forecast_api.lru,
+            "place name": cached_location_api.lru,
+        }
     )
 
-    await dp.start_polling(bot)
+    send_queue.start()
+
+    if WEBHOOK_SETTINGS["url"]:
+        await run_webhook(bot, dp, WEBHOOK_SETTINGS, set_webhook=worker == 0)
+    else:
+        await bot.delete_webhook()
+        await dp.start_polling(bot)
+
+    await send_queue.stop()
+    await fsm_storage.close()
+
+    await location_http_client.aclose()
+    await weather_http_client.aclose()
     await db_engine.dispose()
 
 
-if __name__ == "__main__":
+async def migrate() -> None:
+    db_engine = DBEngine(DATABASE_URL, DB_ENGINE_SETTINGS)
+    await db_engine.migrate()
+    await db_engine.dispose()
+
+
+def serve(worker: int) -> None:
     logging.basicConfig(level=logging.INFO, stream=sys.stdout)
-    asyncio.run(main())
+    asyncio.run(main(worker))
+
+
+def serve_workers() -> None:
+    workers = [
+        multiprocessing.Process(target=serve, args=(worker,), name=f"webhook-worker-{worker}")
+        for worker in range(WEBHOOK_SETTINGS["workers"])
+    ]
+
+    for process in workers:
+        process.start()
+
+    # workers are stopped gracefully by their own signal handlers
+    def stop_workers(*_) -> None:
+        for process in workers:
+            process.terminate()
+
+    signal.signal(signal.SIGINT, stop_workers)
+    signal.signal(signal.SIGTERM, stop_workers)
+
+    for process in workers:
+        process.join()
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["migrate"]:
+        logging.basicConfig(level=logging.INFO, stream=sys.stdout)
+        asyncio.run(migrate())
+    elif WEBHOOK_SETTINGS["url"] and WEBHOOK_SETTINGS["workers"] > 1:
+        serve_workers()
+    else:
+        serve(0)
@@ -1,2 +1,13 @@
 from .weather_api import *  # noqa
+from .weather_forecast_api import DailyTemperatures  # noqa
+from .grid_forecast import GridWeatherForecastAPI  # noqa
+from .forecast_storage import ForecastStorage, StoredForecast  # noqa
+from .cached_forecast import CachedWeatherForecastAPI  # noqa
 from .tire_type import *  # noqa
+from .tire_decisions import (  # noqa
+    TireDecisionRules,
+    TireSwitches,
+    pack_daily_temperatures,
+    decide_tire_switches,
+    get_chat_switches,
+)
@@ -0,0 +1,113 @@
+import logging
+from datetime import UTC, datetime, timedelta
+from itertools import islice
+
+from common import LRUCache
+from location import Location, LocationKey, get_location_cell, get_location_key
+
+from .forecast_storage import ForecastStorage
+from .weather_forecast_api import WeatherForecastAPI, DailyTemperatures
+
+logger = logging.getLogger(__name__)
+
+
+class CachedWeatherForecastAPI(WeatherForecastAPI):
+    """
+    Reads forecasts through the in-process LRU and the persistent storage,
+    the provider is requested only for grid cells without a fresh forecast.
+    At least `days` days are requested, so short and long forecasts share entries.
+    """
+
+    def __init__(
+        self,
+        weather_forecast_api: WeatherForecastAPI,
+        storage: ForecastStorage,
+        cell_size: float,
+        days: int,
+        ttl: float,
+        lru_size: int,
+    ) -> None:
+        self.weather_forecast_api = weather_forecast_api
+        self.storage = storage
+        self.cell_size = cell_size
+        self.days = days
+        self.ttl = ttl
+        self.lru: LRUCache[LocationKey, DailyTemperatures] = LRUCache(lru_size, ttl)
+
+    async def get_daily_temperatures(self, location: Location, days: int) -> DailyTemperatures:
+        daily_temperatures = await self.get_many_daily_temperatures([location], days)
+        return daily_temperatures[get_location_key(location)]
+
+    async def get_many_daily_temperatures(
+        self, locations: list[Location], days: int
+    ) -> dict[LocationKey, DailyTemperatures]:
+        location_cells = {
+            get_location_key(location): get_location_key(get_location_cell(location, self.cell_size))
+            for location in locations
+        }
+        cells = list(dict.fromkeys(location_cells.values()))
+
+        forecasts = {}
+        for cell in cells:
+            daily_temperatures = self.lru.get(cell)
+
+            if daily_temperatures is not None and self.covers_days(daily_temperatures, days):
+                forecasts[cell] = daily_temperatures
+
+        missing_cells = [cell for cell in cells if cell not in forecasts]
+        if missing_cells:
+            forecasts.update(await self.load_forecasts(missing_cells, days))
+
+        missing_cells = [cell for cell in cells if cell not in forecasts]
+        if missing_cells:
+            forecasts.update(await self.fetch_forecasts(missing_cells, days))
+
+        return {
+            key: dict(islice(forecasts[cell].items(), days))
+            for key, cell in location_cells.items()
+            if cell in forecasts
+        }
+
+    def covers_days(self, daily_temperatures: DailyTemperatures, days: int) -> bool:
+        # every entry was requested for at least `self.days` days,
+        # the provider may still return fewer days than requested depending on the plan
+        return days <= self.days or len(daily_temperatures) >= days
+
+    async def load_forecasts(self, cells: list[LocationKey], days: int) -> dict[LocationKey, DailyTemperatures]:
+        now = datetime.now(UTC)
+
+        try:
+            stored_forecasts = await self.storage.get_forecasts(cells, now - timedelta(seconds=self.ttl))
+        except Exception as e:
+            logger.exception(e)
+            return {}
+
+        forecasts = {}
+        for cell, stored_forecast in stored_forecasts.items():
+            daily_temperatures = stored_forecast["daily_temperatures"]
+
+            if not self.covers_days(daily_temperatures, days):
+                continue
+
+            ttl = self.ttl - (now - stored_forecast["fetched_at"]).total_seconds()
+            self.lru.set(cell, daily_temperatures, ttl)
+            forecasts[cell] = daily_temperatures
+
+        return forecasts
+
+    async def fetch_forecasts(self, cells: list[LocationKey], days: int) -> dict[LocationKey, DailyTemperatures]:
+        fetched_at = datetime.now(UTC)
+        forecasts = await self.weather_forecast_api.get_many_daily_temperatures(
+            [{"lat": lat, "lon": lon} for lat, lon in cells], max(days, self.days)
+        )
+
+        for cell, daily_temperatures in forecasts.items():
+            self.lru.set(cell, daily_temperatures)
+
+        if forecasts:
+            try:
+                await self.storage.save_forecasts(forecasts, fetched_at)
+            except Exception as e:
+                logger.exception(e)
+
+        return forecasts
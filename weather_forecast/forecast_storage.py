@@ -0,0 +1,24 @@
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import TypedDict
+
+from location import LocationKey
+
+from .weather_forecast_api import DailyTemperatures
+
+
+class StoredForecast(TypedDict):
+    fetched_at: datetime
+    daily_temperatures: DailyTemperatures
+
+
+class ForecastStorage(ABC):
+    @abstractmethod
+    async def get_forecasts(
+        self, cells: list[LocationKey], fetched_after: datetime
+    ) -> dict[LocationKey, StoredForecast]:
+        pass
+
+    @abstractmethod
+    async def save_forecasts(self, forecasts: dict[LocationKey, DailyTemperatures], fetched_at: datetime) -> None:
+        pass
@@ -0,0 +1,78 @@
+import asyncio
+
+from location import Location, LocationKey, get_location_cell, get_location_key
+
+from .weather_forecast_api import WeatherForecastAPI, DailyTemperatures
+
+
+class GridWeatherForecastAPI(WeatherForecastAPI):
+    """
+    Snaps locations to grid cells and requests the forecast once per cell,
+    concurrent requests for the same cell share a single provider call.
+    The instance is meant to live for a single alerts check run.
+    """
+
+    def __init__(self, weather_forecast_api: WeatherForecastAPI, cell_size: float) -> None:
+        self.weather_forecast_api = weather_forecast_api
+        self.cell_size = cell_size
+        self.daily_temperatures: dict[tuple[LocationKey, int], asyncio.Future[DailyTemperatures]] = {}
+        # the loop keeps only weak references to tasks
+        self.fetch_tasks: set[asyncio.Task] = set()
+
+    async def get_daily_temperatures(self, location: Location, days: int) -> DailyTemperatures:
+        daily_temperatures = await self.get_many_daily_temperatures([location], days)
+        return daily_temperatures[get_location_key(location)]
+
+    async def get_many_daily_temperatures(
+        self, locations: list[Location], days: int
+    ) -> dict[LocationKey, DailyTemperatures]:
+        location_cells = {
+            get_location_key(location): get_location_cell(location, self.cell_size) for location in locations
+        }
+        cells = {get_location_key(cell): cell for cell in location_cells.values()}
+
+        missing_cells = {key: cell for key, cell in cells.items() if (key, days) not in self.daily_temperatures}
+        if missing_cells:
+            loop = asyncio.get_running_loop()
+            for key in missing_cells:
+                self.daily_temperatures[(key, days)] = loop.create_future()
+
+            fetch_task = asyncio.create_task(self.fetch_daily_temperatures(missing_cells, days))
+            self.fetch_tasks.add(fetch_task)
+            fetch_task.add_done_callback(self.fetch_tasks.discard)
+
+        # the futures are shared with other chats of the cells, so they must survive a cancelled caller
+        results = await asyncio.gather(
+            *(asyncio.shield(self.daily_temperatures[(key, days)]) for key in cells),
+            return_exceptions=True,
+        )
+        cell_daily_temperatures = {
+            key: result for key, result in zip(cells, results) if not isinstance(result, BaseException)
+        }
+
+        return {
+            key: cell_daily_temperatures[get_location_key(cell)]
+            for key, cell in location_cells.items()
+            if get_location_key(cell) in cell_daily_temperatures
+        }
+
+    async def fetch_daily_temperatures(self, cells: dict[LocationKey, Location], days: int) -> None:
+        daily_temperatures: dict[LocationKey, DailyTemperatures] = {}
+        error: Exception = LookupError("The forecast is not available for the cell")
+
+        try:
+            daily_temperatures = await self.weather_forecast_api.get_many_daily_temperatures(list(cells.values()), days)
+        except Exception as e:
+            error = e
+        finally:
+            # the futures are resolved even when the task is cancelled, so the chats of the cells do not wait for them
+            for key in cells:
+                future = self.daily_temperatures[(key, days)]
+
+                if future.done():
+                    continue
+
+                if key in daily_temperatures:
+                    future.set_result(daily_temperatures[key])
+                else:
+                    future.set_exception(error)
@@ -0,0 +1,97 @@
+import operator
+from array import array
+from collections.abc import Sequence
+from itertools import repeat
+from typing import NamedTuple, TypedDict
+
+from .tire_type import TEMPERATURE_THRESHOLD, TireType
+from .weather_forecast_api import DailyTemperatures
+
+
+class TireDecisionRules(TypedDict):
+    # half-width (in °C) of the band around the threshold in which chats keep their current tires
+    hysteresis: float
+    # minimum number of consecutive forecast days beyond the band needed to switch tires
+    min_consecutive_days: int
+
+
+class TireSwitches(NamedTuple):
+    """
+    Decisions for a batch of forecasts, e.g. the grid cells of the chats being checked.
+    """
+
+    # average temperature of every forecast
+    avg_temperatures: array
+    # whether chats should switch their tires, at `forecast index * 2 + current tire type`
+    switches: bytes
+
+
+def pack_daily_temperatures(daily_temperatures: Sequence[DailyTemperatures]) -> tuple[array, array]:
+    """
+    Pack forecasts into flat arrays: temperatures of all days and the offset of every forecast in them,
+    the days of the forecast `i` are `temperatures[offsets[i]:offsets[i + 1]]`.
+    """
+    temperatures = array("d")
+    offsets = array("q", [0])
+
+    for forecast in daily_temperatures:
+        temperatures.extend(forecast.values())
+        offsets.append(len(temperatures))
+
+    return temperatures, offsets
+
+
+def decide_tire_switches(temperatures: array, offsets: array, rules: TireDecisionRules) -> TireSwitches:
+    """
+    Decide for every forecast whether chats on winter and on summer tires should switch them,
+    in a single pass over the packed days. Without hysteresis and consecutive days the decisions match
+    `get_tire_type_by_avg_temperature`, the rules only make switching harder.
+    """
+    summer_from = TEMPERATURE_THRESHOLD + rules["hysteresis"]
+    winter_below = TEMPERATURE_THRESHOLD - rules["hysteresis"]
+    min_days = rules["min_consecutive_days"]
+
+    avg_temperatures = array("d")
+    switches = bytearray(2 * (len(offsets) - 1))
+
+    for index, (start, end) in enumerate(zip(offsets, offsets[1:])):
+        days = temperatures[start:end]
+        avg_temperature = sum(days) / len(days)
+        avg_temperatures.append(avg_temperature)
+
+        if avg_temperature >= summer_from and count_consecutive_days(days, summer_from, True) >= min_days:
+            switches[2 * index + TireType.Winter] = 1
+
+        if avg_temperature < winter_below and count_consecutive_days(days, winter_below, False) >= min_days:
+            switches[2 * index + TireType.Summer] = 1
+
+    return TireSwitches(avg_temperatures, bytes(switches))
+
+
+def count_consecutive_days(days: array, threshold: float, above: bool) -> int:
+    """
+    Longest streak of days at or above the threshold, or below it.
+    """
+    longest = streak = 0
+
+    for temperature in days:
+        streak = streak + 1 if (temperature >= threshold) == above else 0
+        longest = max(longest, streak)
+
+    return longest
+
+
+def get_chat_switches(
+    tire_switches: TireSwitches, forecast_indices: Sequence[int], tire_types: Sequence[int]
+) -> tuple[int, ...]:
+    """
+    Gather the decisions of many chats at once, given the index of the forecast and the current tire type of each.
+    """
+    if not forecast_indices:
+        return ()
+
+    positions = map(operator.add, map(operator.mul, forecast_indices, repeat(2)), tire_types)
+    switches = operator.itemgetter(*positions)(tire_switches.switches)
+
+    # itemgetter of a single position returns the item itself
+    return switches if isinstance(switches, tuple) else (switches,)
@@ -1,3 +1,7 @@
+# Average temperature (in °C) below which winter tires are recommended
+TEMPERATURE_THRESHOLD = 7
+
+
 class TireType:
     Winter = 0
     Summer = 1
@@ -9,7 +13,7 @@ class AlertType:
 
 
 def get_tire_type_by_avg_temperature(avg_temperature: float) -> int:
-    return TireType.Winter if avg_temperature < 7 else TireType.Summer
+    return TireType.Winter if avg_temperature < TEMPERATURE_THRESHOLD else TireType.Summer
 
 
 def get_opposite_tire_type(tire_type: int) -> int:
@@ -1,35 +1,123 @@
-from httpx import AsyncClient
+import asyncio
+import logging
+from datetime import date
+from itertools import batched
 
-from location import Location
+from httpx import AsyncClient, HTTPStatusError
 
-from .weather_forecast_api import WeatherForecastAPI
+from location import Location, LocationKey, get_location_key
+
+from .weather_forecast_api import WeatherForecastAPI, DailyTemperatures
+
+logger = logging.getLogger(__name__)
 
 BASE_URL = "https://api.weatherapi.com/v1/forecast.json"
 
+# Maximum number of locations in a single bulk request
+BULK_SIZE = 50
+
+
+def get_forecast_daily_temperatures(data: dict) -> DailyTemperatures:
+    return {
+        date.fromisoformat(forecast["date"]): forecast["day"]["avgtemp_c"]
+        for forecast in data["forecast"]["forecastday"]
+    }
+
 
 class WeatherAPI(WeatherForecastAPI):
     # https://www.weatherapi.com/docs/
 
-    def __init__(self, api_key) -> None:
+    def __init__(
+        self,
+        api_key,
+        client: AsyncClient,
+        max_concurrency: int,
+        bulk_size: int = BULK_SIZE,
+        base_url: str | None = None,
+    ) -> None:
         self.api_key = api_key
+        self.client = client
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        # bulk requests are not available on every plan, 0 disables them
+        self.bulk_size = min(bulk_size, BULK_SIZE)
+        self.base_url = base_url or BASE_URL
 
-    async def get_avg_temperature(self, location: Location, days: int) -> float:
+    async def get_daily_temperatures(self, location: Location, days: int) -> DailyTemperatures:
         params = {
             "key": self.api_key,
             "q": f"{location['lat']},{location['lon']}",
             "days": days,
         }
 
-        async with AsyncClient() as client:
-            response = await client.get(BASE_URL, params=params)
-            data = response.json()
+        async with self.semaphore:
+            response = await self.client.get(self.base_url, params=params)
+
+        return get_forecast_daily_temperatures(response.json())
 
-        forecasts = list(
-            map(
-                lambda f: f["day"]["avgtemp_c"],
-                data["forecast"]["forecastday"],
-            )
+    async def get_many_daily_temperatures(
+        self, locations: list[Location], days: int
+    ) -> dict[LocationKey, DailyTemperatures]:
+        if self.bulk_size <= 0:
+            return await super().get_many_daily_temperatures(locations, days)
+
+        keys = list(dict.fromkeys(map(get_location_key, locations)))
+
+        results = await asyncio.gather(
+            *(self.get_chunk_daily_temperatures(list(chunk), days) for chunk in batched(keys, self.bulk_size)),
+            return_exceptions=True,
         )
 
-        avg_temp = sum((forecasts)) / len(forecasts)
-        return avg_temp
+        daily_temperatures = {}
+        for result in results:
+            if isinstance(result, Exception):
+                logger.error("Failed to get the daily temperatures in bulk", exc_info=result)
+                continue
+
+            daily_temperatures.update(result)
+
+        return daily_temperatures
+
+    async def get_chunk_daily_temperatures(
+        self, keys: list[LocationKey], days: int
+    ) -> dict[LocationKey, DailyTemperatures]:
+        try:
+            return await self.get_bulk_daily_temperatures(keys, days)
+        except Exception as e:
+            # the key is rejected for bulk requests when its plan does not include them
+            if isinstance(e, HTTPStatusError) and e.response.status_code in (401, 403):
+                logger.warning("Bulk requests are not available, the locations are requested one by one")
+                self.bulk_size = 0
+            else:
+                logger.error("Failed to get the daily temperatures in bulk", exc_info=e)
+
+        return await super().get_many_daily_temperatures([{"lat": lat, "lon": lon} for lat, lon in keys], days)
+
+    async def get_bulk_daily_temperatures(
+        self, keys: list[LocationKey], days: int
+    ) -> dict[LocationKey, DailyTemperatures]:
+        # https://www.weatherapi.com/docs/#intro-request-bulk
+        params = {
+            "key": self.api_key,
+            "q": "bulk",
+            "days": days,
+        }
+        body = {
+            "locations": [{"q": f"{lat},{lon}", "custom_id": str(index)} for index, (lat, lon) in enumerate(keys)],
+        }
+
+        async with self.semaphore:
+            response = await self.client.post(self.base_url, params=params, json=body)
+
+        response.raise_for_status()
+
+        daily_temperatures = {}
+        for item in response.json()["bulk"]:
+            query = item["query"]
+
+            # the location failed to resolve, the query holds an error instead
+            if "forecast" not in query:
+                continue
+
+            daily_temperatures[keys[int(query["custom_id"])]] = get_forecast_daily_temperatures(query)
+
+        return daily_temperatures
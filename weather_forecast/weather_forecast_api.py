@@ -1,9 +1,54 @@
+import asyncio
+import logging
 from abc import ABC, abstractmethod
+from datetime import date
 
-from location import Location
+from location import Location, LocationKey, get_location_key
+
+logger = logging.getLogger(__name__)
+
+# The average temperature of each forecast day, ordered by date
+type DailyTemperatures = dict[date, float]
+
+
+def calculate_avg_temperature(daily_temperatures: DailyTemperatures) -> float:
+    return sum(daily_temperatures.values()) / len(daily_temperatures)
 
 
 class WeatherForecastAPI(ABC):
     @abstractmethod
-    async def get_avg_temperature(self, location: Location, days: int) -> float:
+    async def get_daily_temperatures(self, location: Location, days: int) -> DailyTemperatures:
         pass
+
+    async def get_many_daily_temperatures(
+        self, locations: list[Location], days: int
+    ) -> dict[LocationKey, DailyTemperatures]:
+        """
+        Get the daily temperatures for many locations, keyed by `get_location_key`.
+        Locations that could not be resolved are missing from the result.
+        The fallback requests every location concurrently,
+        providers with bulk requests support should override it.
+        """
+        keys = list(dict.fromkeys(map(get_location_key, locations)))
+
+        results = await asyncio.gather(
+            *(self.get_daily_temperatures({"lat": lat, "lon": lon}, days) for lat, lon in keys),
+            return_exceptions=True,
+        )
+
+        daily_temperatures = {}
+        for key, result in zip(keys, results):
+            if isinstance(result, Exception):
+                logger.error("Failed to get the daily temperatures for %s", key, exc_info=result)
+                continue
+
+            daily_temperatures[key] = result
+
+        return daily_temperatures
+
+    async def get_avg_temperature(self, location: Location, days: int) -> float:
+        return calculate_avg_temperature(await self.get_daily_temperatures(location, days))
+
+    async def get_avg_temperatures(self, locations: list[Location], days: int) -> dict[LocationKey, float]:
+        daily_temperatures = await self.get_many_daily_temperatures(locations, days)
+        return {key: calculate_avg_temperature(temperatures) for key, temperatures in daily_temperatures.items()}